@@ -7,6 +7,7 @@ __version__ = "1.0a1"
 
 from .utils import get_from_env, Stopwatch, merge_markdown, generate_large_label
 from .config import config
+from .catalog import catalog
 
-from .beans import find_bean_by, Bean, BeanCollection
-from .roasts import find_roast_by, Roast, RoastCollection
+from .beans import find_bean_by, Bean, BeanCollection, BeanSummary, bean_registry
+from .roasts import find_roast_by, Roast, RoastCollection, RoastSummary
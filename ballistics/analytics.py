@@ -0,0 +1,151 @@
+"""
+Analytics.
+Roast metrics computed in batch across the whole collection: the bean temperature curves of every roast are stacked
+into one (NaN padded) NumPy array, and each metric is a vectorized operation over all of them at once.
+"""
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from .archive import load_archive
+from .catalog import catalog, RoastEntry
+from .config import config
+from .curves import read_curves
+from .curvestore import curve_store
+
+
+def stack_curves(curves: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stack curves of different lengths into one 2D array, padded with NaN
+    :param curves: list of 1D sample arrays
+    :return: (2D float32 array of shape (roasts, longest curve), array of the curve lengths)
+    """
+    lengths = np.array([len(curve) for curve in curves], dtype=np.int64)
+    stacked = np.full((len(curves), max(lengths.max(initial=0), 1)), np.nan, dtype=np.float32)
+    for row, curve in enumerate(curves):
+        stacked[row, :len(curve)] = curve
+    return stacked, lengths
+
+
+def rate_of_rise(temps: np.ndarray, rates: np.ndarray, window: float = 30.0) -> np.ndarray:
+    """
+    Rate of rise (degrees per minute) of every curve, measured over a trailing window
+    :param temps: 2D array of temperature curves (one roast per row, NaN padded)
+    :param rates: sample rate (samples per second) of each roast
+    :param window: length of the trailing window, in seconds
+    :return: 2D array the same shape as temps, NaN where there isn't a full window of samples
+    """
+    lag = np.maximum(np.round(window * rates).astype(np.int64), 1)
+    columns = np.arange(temps.shape[1])
+    lagged = columns[None, :] - lag[:, None]
+    valid = lagged >= 0
+    previous = np.take_along_axis(temps, np.clip(lagged, 0, None), axis=1)
+    ror = (temps - previous) * (60.0 / (lag / rates))[:, None]
+    ror[~valid] = np.nan
+    return ror
+
+
+def bean_temperatures(entries: List[RoastEntry], archive_file: Path = None) -> List[np.ndarray]:
+    """
+    The bean temperature curve of each roast, from wherever it can be read fastest: the curve store, then the .npz
+    archive (if the roast hasn't changed since the archive was exported), and only then the roast's JSON file
+    :param entries: catalog entries
+    :param archive_file: (optional) the archive to read, defaults to config.archiveFile
+    :return: list of sample arrays, in the same order as entries
+    """
+    if not config.initialized:
+        config.init_env()
+    archive_file = Path(archive_file or config.archiveFile)
+    archived = archive_file.exists()
+    archive = None
+    temps = list()
+    for entry in entries:
+        curves = curve_store.curves(entry.roastId, entry.path)
+        if curves is not None:
+            temps.append(curves['beanTemperature'])
+            continue
+        # the archive is only loaded once a roast turns up that isn't in the curve store
+        if archived and archive is None:
+            archive = load_archive(archive_file)
+            exported_at = archive_file.stat().st_mtime_ns
+        if archived and entry.roastId in archive.index and entry.path.stat().st_mtime_ns <= exported_at:
+            curve = archive.curves(entry.roastId)['beanTemperature']
+            # the archive pads the curves of a roast to a common length
+            present = np.flatnonzero(~np.isnan(curve))
+            temps.append(curve[:present[-1] + 1 if present.size else 0])
+            continue
+        temps.append(read_curves(entry.path)['beanTemperature'])
+    return temps
+
+
+def _header_column(entries: List[RoastEntry], key: str, dtype=np.float64) -> np.ndarray:
+    return np.array([entry.header.get(key) or 0 for entry in entries], dtype=dtype)
+
+
+def roast_analytics(entries: Iterable[RoastEntry] = None, window: float = 30.0, loader=None) -> Dict:
+    """
+    Compute the roast metrics for every roast, in batch:
+        chargeTemp / dropTemp: bean temperature at roastStartIndex, and at the last sample
+        turningPointTime / turningPointTemp: the lowest bean temperature between the start and yellowing
+        dryingTime / maillardTime / developmentTime: seconds in each phase (start->yellowing->first crack->end)
+        developmentPct: development time as a percentage of the total roast time
+        maxRoR / maxRoRTime: the highest rate of rise after the start (degrees/minute), and when it happened
+    :param entries: (optional) catalog entries to analyse, defaults to every roast in the catalog
+    :param window: rate of rise window, in seconds
+    :param loader: (optional) function that returns the curves for a roast file, defaults to reading them from the
+        curve store or the archive where they're up to date (see bean_temperatures)
+    :return: columnar table - dict of column name -> array, one row per roast, with a 'roastId' column
+    """
+    if entries is None:
+        catalog.load()
+        entries = catalog.roasts.values()
+    entries = [entry for entry in entries if not entry.isFork and not entry.is_aberrant]
+    if not entries:
+        return {'roastId': np.array([], dtype=object)}
+
+    if loader is None:
+        curves = bean_temperatures(entries)
+    else:
+        curves = [loader(entry.path)['beanTemperature'] for entry in entries]
+    temps, lengths = stack_curves(curves)
+    rows = np.arange(len(entries))
+    rates = _header_column(entries, 'sampleRate')
+    rates[rates <= 0] = 1.0
+    last = np.maximum(lengths - 1, 0)
+    start = np.clip(_header_column(entries, 'roastStartIndex', np.int64), 0, last)
+    yellowing = np.clip(_header_column(entries, 'indexYellowingStart', np.int64), start, last)
+    first_crack = np.clip(_header_column(entries, 'indexFirstCrackStart', np.int64), yellowing, last)
+    total = _header_column(entries, 'totalRoastTime')
+    columns = np.arange(temps.shape[1])
+
+    # turning point: the lowest temperature between charging and yellowing
+    before_yellowing = (columns[None, :] >= start[:, None]) & (columns[None, :] <= yellowing[:, None])
+    turning = np.argmin(np.where(before_yellowing, np.nan_to_num(temps, nan=np.inf), np.inf), axis=1)
+
+    # maximum rate of rise after charging
+    ror = rate_of_rise(temps, rates, window)
+    after_start = columns[None, :] > start[:, None]
+    ror_after = np.where(after_start & ~np.isnan(ror), ror, -np.inf)
+    max_ror_at = np.argmax(ror_after, axis=1)
+    max_ror = ror_after[rows, max_ror_at]
+    max_ror[np.isinf(max_ror)] = np.nan
+
+    development = total - first_crack / rates
+    with np.errstate(divide='ignore', invalid='ignore'):
+        development_pct = np.where(total > 0, development / total * 100.0, np.nan)
+    return {
+        'roastId': np.array([entry.roastId for entry in entries], dtype=object),
+        'batch': np.array([entry.batch for entry in entries], dtype=object),
+        'samples': lengths,
+        'chargeTemp': temps[rows, start],
+        'dropTemp': temps[rows, last],
+        'turningPointTime': (turning - start) / rates,
+        'turningPointTemp': temps[rows, turning],
+        'dryingTime': (yellowing - start) / rates,
+        'maillardTime': (first_crack - yellowing) / rates,
+        'developmentTime': development,
+        'developmentPct': development_pct,
+        'maxRoR': max_ror,
+        'maxRoRTime': (max_ror_at - start) / rates,
+    }
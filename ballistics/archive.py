@@ -0,0 +1,127 @@
+"""
+Archive.
+Exports every roast (header fields and time-series) into one columnar .npz archive, and loads it back.
+Each curve is stored as one long concatenated array, with an offsets array marking where each roast starts, so
+opening the archive is a handful of array reads rather than a JSON parse per roast.
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from .catalog import catalog, RoastEntry
+from .config import config
+from .curves import CURVE_NAMES, read_curves
+from .utils import Stopwatch
+
+# header fields stored as columns in the archive (text fields, then numeric fields)
+TEXT_FIELDS = ('roastId', 'beanId', 'roastName', 'batch')
+NUMERIC_FIELDS = ('dateTime', 'weightGreen', 'weightRoasted', 'weightLossPct', 'totalRoastTime', 'sampleRate',
+                  'roastStartIndex', 'indexYellowingStart', 'indexFirstCrackStart', 'roastDegree',
+                  'roastTimeDrying', 'roastTimeDevelopment', 'roastDVPct')
+
+
+def export_archive(archive_file: Path = None, entries: Iterable[RoastEntry] = None, loader=read_curves) -> Path:
+    """
+    Write every roast's header fields and curves to a columnar .npz archive
+    :param archive_file: (optional) where to write the archive, defaults to config.archiveFile
+    :param entries: (optional) catalog entries to export, defaults to every roast in the catalog
+    :param loader: function that returns the curves for a roast file (defaults to reading the JSON)
+    :return: Path of the archive
+    """
+    timer = Stopwatch()
+    if entries is None:
+        catalog.load()
+        entries = catalog.roasts.values()
+    entries = [entry for entry in entries if not entry.isFork and not entry.is_aberrant]
+    archive_file = Path(archive_file or config.archiveFile)
+
+    columns = dict()
+    columns['roastId'] = np.array([entry.roastId for entry in entries], dtype=str)
+    columns['beanId'] = np.array([entry.beanId or '' for entry in entries], dtype=str)
+    columns['roastName'] = np.array([entry.name for entry in entries], dtype=str)
+    columns['batch'] = np.array([entry.batch for entry in entries], dtype=str)
+    for name in NUMERIC_FIELDS:
+        columns[name] = np.array([entry.header.get(name) or 0 for entry in entries], dtype=np.float64)
+
+    series = {name: list() for name in CURVE_NAMES}
+    lengths = np.zeros(len(entries), dtype=np.int64)
+    for row, entry in enumerate(entries):
+        curves = loader(entry.path)
+        # curves are stored with a common length per roast, so one offsets array serves them all
+        lengths[row] = max(len(curve) for curve in curves.values())
+        for name in CURVE_NAMES:
+            curve = np.full(lengths[row], np.nan, dtype=np.float32)
+            curve[:len(curves[name])] = curves[name]
+            series[name].append(curve)
+    columns['offsets'] = np.concatenate(([0], np.cumsum(lengths)))
+    for name in CURVE_NAMES:
+        columns[name] = np.concatenate(series[name]) if entries else np.array([], dtype=np.float32)
+
+    if not archive_file.parent.exists():
+        archive_file.parent.mkdir(parents=True)
+    with open(archive_file, 'wb') as af:
+        np.savez(af, **columns)
+    config.logger.info(f"Exported {len(entries)} roasts to {archive_file} in {timer.stop():.2f}s")
+    return archive_file
+
+
+@dataclass
+class RoastArchive:
+    """
+    A roast archive, loaded back into memory:
+        columns: dict of header column name -> array (one row per roast)
+        series: dict of curve name -> concatenated array of every roast's samples
+        offsets: roast i's samples are series[name][offsets[i]:offsets[i + 1]]
+    """
+    columns: Dict[str, np.ndarray] = field(default_factory=dict)
+    series: Dict[str, np.ndarray] = field(default_factory=dict)
+    offsets: np.ndarray = None
+    index: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def roast_ids(self) -> List[str]:
+        return list(self.index)
+
+    def header(self, roast_id: str) -> Dict:
+        """
+        :param roast_id: the roastId to look up
+        :return: dict of that roast's header fields
+        """
+        row = self.index[roast_id]
+        return {name: column[row].item() for name, column in self.columns.items()}
+
+    def curves(self, roast_id: str) -> Dict[str, np.ndarray]:
+        """
+        :param roast_id: the roastId to look up
+        :return: dict of curve name -> sample array (views into the archive, not copies)
+        """
+        row = self.index[roast_id]
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return {name: series[start:end] for name, series in self.series.items()}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self.index)} roasts)"
+
+
+def load_archive(archive_file: Path = None) -> RoastArchive:
+    """
+    Load a roast archive written by export_archive
+    :param archive_file: (optional) the archive to load, defaults to config.archiveFile
+    :return: RoastArchive
+    """
+    if archive_file is None:
+        if not config.initialized:
+            config.init_env()
+        archive_file = config.archiveFile
+    with np.load(archive_file) as data:
+        arrays = {name: data[name] for name in data.files}
+    archive = RoastArchive(offsets=arrays.pop('offsets'))
+    archive.series = {name: arrays.pop(name) for name in CURVE_NAMES}
+    archive.columns = arrays
+    archive.index = {roast_id: row for row, roast_id in enumerate(arrays['roastId'].tolist())}
+    return archive
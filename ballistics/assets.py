@@ -0,0 +1,105 @@
+"""
+Assets.
+Publishes generated files (label and profile images, blend pages) into the publish directory without copying the
+bytes where the filesystem allows it: a reflink (copy-on-write clone) is tried first, then a hardlink, and only then a
+plain copy. Files whose published copy already has the same content are left alone.
+Generated images are always replaced (never rewritten in place), so a linked copy can't change underneath the
+published site. Blend pages are published straight from the annotations, so a hardlinked one follows its source.
+"""
+import errno
+import os
+import shutil
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+from .manifest import BuildManifest, file_hash
+
+# Linux ioctl to clone a file's extents (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+@dataclass
+class PublishStats:
+    """
+    Running count of how the assets were published, and how many bytes actually had to be copied
+    """
+    reflinked: int = 0
+    linked: int = 0
+    copied: int = 0
+    unchanged: int = 0
+    bytes_copied: int = 0
+
+    def __repr__(self):
+        return (f"{self.reflinked} reflinked, {self.linked} hardlinked, {self.copied} copied "
+                f"({self.bytes_copied / 1e6:.1f}MB), {self.unchanged} unchanged")
+
+
+publish_stats = PublishStats()
+
+
+def _reflink(source: Path, dest: Path) -> bool:
+    """
+    Clone source to dest, sharing the data blocks (copy-on-write), if the OS and filesystem support it
+    :return: True if dest was created as a clone
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl
+    try:
+        with open(source, 'rb') as src, open(dest, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        dest.unlink(missing_ok=True)
+        return False
+
+
+def is_same_content(source: Path, dest: Path, manifest: BuildManifest = None) -> bool:
+    """
+    :param source: Path of the file to publish
+    :param dest: Path of the published copy
+    :param manifest: (optional) build manifest, used to memoize the hash of the source
+    :return: True if dest already exists with the same content as source
+    """
+    if not dest.exists():
+        return False
+    if os.path.samefile(source, dest):
+        return True
+    if source.stat().st_size != dest.stat().st_size:
+        return False
+    return file_hash(dest) == (manifest.hash(source) if manifest else file_hash(source))
+
+
+def publish_file(source: Path, dest: Path, manifest: BuildManifest = None) -> int:
+    """
+    Publish a file by reflink, hardlink or (across filesystems) copy - unless dest already has the same content.
+    The new file is created next to dest and renamed over it, so dest is never seen half written.
+    :param source: Path of the file to publish
+    :param dest: Path to publish it to
+    :param manifest: (optional) build manifest, used to memoize the hash of the source
+    :return: the number of bytes copied (0 if it was linked, or already up to date)
+    """
+    if is_same_content(source, dest, manifest):
+        publish_stats.unchanged += 1
+        return 0
+    if not dest.parent.exists():
+        dest.parent.mkdir(parents=True)
+    tmp_file = dest.with_name(f".{dest.name}.tmp")
+    tmp_file.unlink(missing_ok=True)
+    copied = 0
+    if _reflink(source, tmp_file):
+        publish_stats.reflinked += 1
+    else:
+        try:
+            os.link(source, tmp_file)
+            publish_stats.linked += 1
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+            shutil.copy2(source, tmp_file)
+            copied = tmp_file.stat().st_size
+            publish_stats.copied += 1
+            publish_stats.bytes_copied += copied
+    os.replace(tmp_file, dest)
+    return copied
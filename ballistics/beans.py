@@ -3,29 +3,38 @@ Beans.
 Loading bean data from the Bullet data, and outputting it in various formats
 """
 from dataclasses import dataclass
+from datetime import datetime
 import json
 import os
-from slugify import slugify
+import weakref
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, NamedTuple
 
 import ballistics
-from .utils import Stopwatch
+from .utils import Stopwatch, write_if_changed
 from .config import config
+from .catalog import catalog, BeanEntry
 
 
 @dataclass
 class BeanCollection:
     """
-    Collection of Beans
+    Collection of Beans.
+    In lightweight mode the collection holds BeanSummary records instead of full Beans.
+    If bean_ids is given, the collection only holds those beans (eg the ones that just changed).
     """
+    lightweight: bool = False
+    bean_ids: List[str] = None
+
     def __post_init__(self):
         self.beans = list()
-        if not config.initialized:
-            config.init_env()
-        for file in config.beans_dir.glob('*'):
-            config.logger.debug(f"Collection loading bean: {file.stem}")
-            bean = Bean(file.stem)
+        catalog.load()
+        for bean_id in list(catalog.beans if self.bean_ids is None else self.bean_ids):
+            config.logger.debug(f"Collection loading bean: {bean_id}")
+            if self.lightweight:
+                bean = BeanSummary.from_entry(catalog.bean(bean_id))
+            else:
+                bean = bean_registry.get(bean_id)
             if bean:
                 self.beans.append(bean)
 
@@ -59,87 +68,106 @@ class Bean:
     isOrganic: bool = False
     isDecaf: bool = False
     isForEspresso: bool = False
-    raw: json = None
     roasts: list = None
 
     def __post_init__(self):
         if not config.initialized:
             config.init_env()
-        with open(config.beans_dir / self.beanId) as json_file:
-            self.raw = json.load(json_file)
-        self.beanId = self.raw.get('uid')
-        self.name = self.raw.get('name')
+        entry = catalog.bean(self.beanId)
+        self.path = entry.path
+        self.header = entry.header
+        self._raw = None
+        self.beanId = self.header.get('uid')
+        self.name = self.header.get('name')
+        # slugify (and its unicode tables) is only imported once a bean is actually built
+        from slugify import slugify
         self.slug = slugify(self.name)
         # local and remote URLs
         self.urlSite = f"/beans/{self.slug}"
         self.url = config.baseUrl + self.urlSite
         if 'decaf' in self.name.casefold():
             self.isDecaf = True
-        self.description = self.raw.get('description')
-        self.country = self.raw.get('country')
+        self.description = self.header.get('description')
+        self.country = self.header.get('country')
         if not self.country:
             self.country = 'Blend/Unknown'
-        self.region = self.raw.get('region')
-        self.farm = self.raw.get('farm')
-        self.process = self.raw.get('process')
+        self.region = self.header.get('region')
+        self.farm = self.header.get('farm')
+        self.process = self.header.get('process')
         # TODO: check to make sure this always resolved to true or false
-        self.isOrganic = self.raw.get('isOrganic')
-        self.isForEspresso = self.raw.get('espresso')
-        self.roasts = ballistics.find_roast_by(self.beanId, 'beanid').get(self.beanId) or list()
+        self.isOrganic = self.header.get('isOrganic')
+        self.isForEspresso = self.header.get('espresso')
+        self.roasts = catalog.roasts_for_bean(self.beanId)
 
     def to_markdown(self) -> Path:
         """
-        Output the Bean as a markdown file.
+        Output the Bean as a markdown file. The file is only rewritten if its content has changed.
         :return: Path of the output file
         """
-        output_beans_dir = config.outputDir / "beans"
-        # output_roast_dir = config.outputDir / "roasts"
-        if not output_beans_dir.exists():
-            output_beans_dir.mkdir(parents=True)
-        output_file = output_beans_dir / f"{self.name.strip()}.md"
-        with open(output_file, 'w') as beanf:
-            roasts = self.get_roasts()
-            # write out the frontmatter
-            beanf.write("---\n")
-            beanf.write(f"title: {self.name}\n")
-            beanf.write(f"origin: {self.country}\n")
-            beanf.write(f"slug: {self.slug}\n")
-            beanf.write("type: bean\n")
-            beanf.write(f"path: {self.urlSite}\n")
-            beanf.write(f"rwUrl: https://roast.world/beans/{self.beanId}\n")
-            if roasts:
-                beanf.write(f"lastRoasted: {max(r.roastDate for r in roasts).isoformat(' ', 'minutes')}\n")
-            else:
-                beanf.write(f"lastRoasted: \n")
-            beanf.write("tags:\n")
-            beanf.write(" - roastedby\n")
-            beanf.write(" - bean\n")
-            if self.isDecaf:
-                beanf.write(" - decaf\n")
-            if self.isOrganic:
-                beanf.write(" - organic\n")
-            if self.isForEspresso:
-                beanf.write(" - espresso\n")
-            beanf.write("---\n")
-            # write out the semi-structured
-            # TODO: add in details
-            beanf.write(f"# {self.name}:\n")
-            beanf.write(f"### Importer's Description:\n{self.description}\n")
-            beanf.write("\n")
-            if roasts:
-                beanf.write(f"### Roasts made with this bean ({round(sum([item.weightGreen for item in roasts])/1000, 1)}kg):\n")
-                for roast in roasts:
-                    beanf.write(f"- [{roast.batch}]({roast.urlSite}): {roast.weightGreen}g on {roast.roastDate.strftime('%a %D')}\n")
-        beanf.close()
+        output_file = self.markdown_file
+        md = list()
+        # the roast details and usage come from the catalog, so no Roasts need to be loaded
+        roasts = [catalog.roast(roast_id) for roast_id in self.roasts]
+        usage = catalog.bean_usage().get(self.beanId)
+        # write out the frontmatter
+        md.append("---\n")
+        md.append(f"title: {self.name}\n")
+        md.append(f"origin: {self.country}\n")
+        md.append(f"slug: {self.slug}\n")
+        md.append("type: bean\n")
+        md.append(f"path: {self.urlSite}\n")
+        md.append(f"rwUrl: https://roast.world/beans/{self.beanId}\n")
+        if usage:
+            md.append(f"lastRoasted: {usage.lastRoasted.isoformat(' ', 'minutes')}\n")
+        else:
+            md.append(f"lastRoasted: \n")
+        md.append("tags:\n")
+        md.append(" - roastedby\n")
+        md.append(" - bean\n")
+        if self.isDecaf:
+            md.append(" - decaf\n")
+        if self.isOrganic:
+            md.append(" - organic\n")
+        if self.isForEspresso:
+            md.append(" - espresso\n")
+        md.append("---\n")
+        # write out the semi-structured
+        # TODO: add in details
+        md.append(f"# {self.name}:\n")
+        md.append(f"### Importer's Description:\n{self.description}\n")
+        md.append("\n")
+        if usage:
+            md.append(f"### Roasts made with this bean ({round(usage.totalGreen/1000, 1)}kg):\n")
+            for roast in roasts:
+                roast_date = datetime.fromtimestamp(roast.header.get('dateTime') / 1000)
+                md.append(f"- [{roast.batch}](/roasts/{roast.batch}): {roast.header['weightGreen']}g on {roast_date.strftime('%a %D')}\n")
+        write_if_changed(output_file, ''.join(md))
         return output_file
 
+    @property
+    def markdown_file(self) -> Path:
+        """
+        Path of the markdown file for this bean, in the output directory
+        """
+        return config.outputDir / "beans" / f"{self.name.strip()}.md"
+
+    @property
+    def raw(self) -> Dict:
+        """
+        The full JSON file from RoasTime, read from disk on first access
+        """
+        if self._raw is None:
+            with open(self.path) as json_file:
+                self._raw = json.load(json_file)
+        return self._raw
+
     def get_roasts(self) -> List:
         """
         Loads and returns all the roasts that use this bean
         :return: list of Roasts
         """
         results = list()
-        roasts = ballistics.find_roast_by(self.beanId, 'beanid').get(self.beanId)
+        roasts = catalog.roasts_for_bean(self.beanId)
         # if there are no roasts for the bean, skip it
         if roasts:
             for roast_id in roasts:
@@ -153,6 +181,103 @@ class Bean:
         return f"{self.__class__.__name__}({self.name})"
 
 
+class BeanSummary(NamedTuple):
+    """
+    Compact, immutable summary of a Bean: just the scalar fields, for listing and filtering in bulk.
+    It's a NamedTuple, so there's no per-instance __dict__ (or raw JSON). to_bean() returns the full Bean.
+    """
+    beanId: str
+    name: str
+    slug: str
+    country: str
+    region: str
+    farm: str
+    process: str
+    isOrganic: bool
+    isDecaf: bool
+    isForEspresso: bool
+    roastCount: int
+
+    @classmethod
+    def from_entry(cls, entry: BeanEntry) -> 'BeanSummary':
+        """
+        :param entry: the bean's catalog entry
+        :return: BeanSummary, with the same values a Bean would have
+        """
+        from slugify import slugify
+        header = entry.header
+        name = header.get('name')
+        return cls(beanId=entry.beanId, name=name, slug=slugify(name), country=header.get('country') or 'Blend/Unknown',
+                   region=header.get('region'), farm=header.get('farm'), process=header.get('process'),
+                   isOrganic=header.get('isOrganic'), isDecaf='decaf' in name.casefold(),
+                   isForEspresso=header.get('espresso'), roastCount=len(catalog.roasts_for_bean(entry.beanId)))
+
+    @property
+    def urlSite(self) -> str:
+        return f"/beans/{self.slug}"
+
+    def to_bean(self) -> 'Bean':
+        """
+        :return: the full (shared) Bean
+        """
+        return bean_registry.get(self.beanId)
+
+
+class BeanRegistry(object):
+    """
+    Identity map of Beans, so every Roast (and collection) of the same bean shares one Bean object.
+    The Beans are only weakly referenced, so the registry doesn't keep a Bean alive once nothing else uses it.
+    BeanRegistry.get() returns the shared Bean for a beanId, building it if it doesn't exist (or is out of date)
+    BeanRegistry.invalidate() drops a bean (or all of them), eg when its file has changed on disk
+    """
+
+    def __init__(self):
+        self._beans = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, bean_id: str) -> 'Bean':
+        """
+        :param bean_id: the beanId to look up
+        :return: the shared Bean for that beanId
+        """
+        entry = catalog.bean(bean_id)
+        bean = self._beans.get(bean_id)
+        # the catalog replaces the entry (and its header) whenever it re-reads the file
+        if bean is None or bean.header is not entry.header:
+            bean = Bean(bean_id)
+            self._beans[bean_id] = bean
+            self.misses += 1
+        else:
+            self.hits += 1
+        return bean
+
+    def invalidate(self, bean_id: str = None) -> None:
+        """
+        Drop a bean from the registry, and have the catalog re-read its file (if it changed) or forget it (if it was
+        deleted). The next get() builds a fresh Bean; Beans already handed out are left as they are.
+        :param bean_id: (optional) the beanId to drop, defaults to every bean in the registry
+        """
+        for bid in [bean_id] if bean_id else list(self._beans):
+            self._beans.pop(bid, None)
+            entry = catalog.beans.get(bid)
+            if entry is None:
+                continue
+            if entry.path.exists():
+                catalog.add_bean(entry.path)
+            else:
+                catalog.remove_bean(bid)
+
+    def __len__(self):
+        return len(self._beans)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self._beans)} beans, {self.hits} hits, {self.misses} misses)"
+
+
+bean_registry = BeanRegistry()
+
+
 def find_bean_by(name: str) -> Dict:
     """
     Searches through the bean repository to find all bean IDs that match a (partial) name provided
@@ -160,13 +285,10 @@ def find_bean_by(name: str) -> Dict:
     :return: dict of matching beans: {name: [ID]}
     """
     beans = dict()
-    for file in config.beans_dir.glob('*'):
-        config.logger.debug(f"Found bean: {file}")
-        with open(file) as json_file:
-            beanf = json.load(json_file)
-        bname = beanf.get('name')
-        if name.casefold() in bname.casefold():
-            if not beans.get(bname):
-                beans[bname] = list()
-            beans[bname].append(beanf.get('uid'))
+    for entry in catalog.search_beans(name):
+        config.logger.debug(f"Found bean: {entry.path}")
+        bname = entry.name
+        if not beans.get(bname):
+            beans[bname] = list()
+        beans[bname].append(entry.header.get('uid'))
     return beans
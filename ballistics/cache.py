@@ -0,0 +1,186 @@
+"""
+Cache.
+A persistent, on disk (SQLite) cache of the header fields of every roast and bean file, keyed by path, mtime and size.
+Only the files that have changed since the last run need to be parsed again.
+It also holds the bean usage aggregates, as a view that's only recalculated for the beans whose roasts changed, and
+the parsed annotation files used when publishing.
+"""
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, Tuple, Union
+
+# bump this whenever the shape of the cached headers changes, and the cache will be rebuilt from scratch
+CACHE_VERSION = 2
+
+
+class CatalogCache(object):
+    """
+    SQLite backed store of file headers.
+    CatalogCache.is_current() checks whether a path's cached header is still valid, without decoding it
+    CatalogCache.get() returns the cached header for a path, if the file's mtime and size still match
+    CatalogCache.put() stores (or replaces) the header for a path
+    CatalogCache.delete() removes the entry (and usage) of a file that has been deleted
+    CatalogCache.prune() removes the entries for all paths that weren't seen since the cache was opened
+    CatalogCache.put_usage() / delete_usage() record (or remove) a roast's contribution to its bean's usage
+    CatalogCache.bean_usage() returns the usage aggregates, refreshing only the beans that have changed
+    CatalogCache.get_annotation() / put_annotation() fetch and store the parsed frontmatter and content of an annotation
+    """
+
+    def __init__(self, db_file: Path):
+        self.db_file = Path(db_file)
+        if not self.db_file.parent.exists():
+            self.db_file.parent.mkdir(parents=True)
+        self._db = sqlite3.connect(self.db_file)
+        if self._db.execute('PRAGMA user_version').fetchone()[0] != CACHE_VERSION:
+            for table in ('files', 'roast_usage', 'bean_usage', 'annotations'):
+                self._db.execute(f"DROP TABLE IF EXISTS {table}")
+            self._db.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+        self._db.execute('CREATE TABLE IF NOT EXISTS files '
+                         '(path TEXT PRIMARY KEY, kind TEXT, mtime INTEGER, size INTEGER, header TEXT)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS roast_usage '
+                         '(path TEXT PRIMARY KEY, beanId TEXT, weightGreen REAL, dateTime INTEGER, weightLossPct REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS roast_usage_bean ON roast_usage (beanId)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS bean_usage (beanId TEXT PRIMARY KEY, totalGreen REAL, '
+                         'roastCount INTEGER, firstRoasted INTEGER, lastRoasted INTEGER, avgLossPct REAL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS annotations '
+                         '(path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, metadata TEXT, content TEXT)')
+        self._dirty_beans = set()
+        self._rows = {row[0]: row[1:] for row in self._db.execute('SELECT path, mtime, size, header FROM files')}
+        self._seen = set()
+
+    @staticmethod
+    def file_key(file: Path) -> Tuple[int, int]:
+        """
+        :param file: Path of the file to stat
+        :return: (mtime in nanoseconds, size in bytes) of the file
+        """
+        stat = file.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def is_current(self, file: Path) -> bool:
+        """
+        :param file: Path of the file
+        :return: True if the file is cached, and hasn't changed since it was cached
+        """
+        row = self._rows.get(str(file))
+        return row is not None and tuple(row[:2]) == self.file_key(file)
+
+    def get(self, file: Path) -> Union[Dict, None]:
+        """
+        Fetches the cached header for a file, as long as the file hasn't changed since it was cached
+        :param file: Path of the file
+        :return: the cached header, or None if it isn't cached (or is stale)
+        """
+        self._seen.add(str(file))
+        row = self._rows.get(str(file))
+        if row is None or tuple(row[:2]) != self.file_key(file):
+            return None
+        return json.loads(row[2])
+
+    def put(self, file: Path, kind: str, header: Dict) -> None:
+        """
+        Stores the header for a file, keyed by its current mtime and size
+        :param file: Path of the file
+        :param kind: 'roast' or 'bean'
+        :param header: JSON-able dict of header fields
+        """
+        self._seen.add(str(file))
+        mtime, size = self.file_key(file)
+        header_json = json.dumps(header)
+        self._db.execute('INSERT OR REPLACE INTO files (path, kind, mtime, size, header) VALUES (?, ?, ?, ?, ?)',
+                         (str(file), kind, mtime, size, header_json))
+        self._rows[str(file)] = (mtime, size, header_json)
+
+    def delete(self, file: Path) -> None:
+        """
+        Removes the cached header of a file (and its bean usage, if it's a roast), eg when it has been deleted
+        :param file: Path of the file
+        """
+        self._db.execute('DELETE FROM files WHERE path = ?', (str(file),))
+        self._rows.pop(str(file), None)
+        self._seen.discard(str(file))
+        self.delete_usage(file)
+
+    def prune(self) -> int:
+        """
+        Removes every cached entry whose file wasn't looked up or stored since the cache was opened
+        :return: the number of entries removed
+        """
+        stale = [path for path in self._rows if path not in self._seen]
+        self._db.executemany('DELETE FROM files WHERE path = ?', ((path,) for path in stale))
+        for path in stale:
+            del self._rows[path]
+            self.delete_usage(Path(path))
+        return len(stale)
+
+    def put_usage(self, file: Path, bean_id: str, weight_green: float, date_time: int, loss_pct: float) -> None:
+        """
+        Records a roast's contribution to its bean's usage, marking the bean (and any bean it moved from) as changed
+        :param file: Path of the roast file
+        :param bean_id: the bean the roast used
+        :param weight_green: green weight (g)
+        :param date_time: roast date, as a RoasTime timestamp (ms)
+        :param loss_pct: weight loss (%)
+        """
+        self.delete_usage(file)
+        self._db.execute('INSERT INTO roast_usage (path, beanId, weightGreen, dateTime, weightLossPct) '
+                         'VALUES (?, ?, ?, ?, ?)', (str(file), bean_id, weight_green, date_time, loss_pct))
+        self._dirty_beans.add(bean_id)
+
+    def delete_usage(self, file: Path) -> None:
+        """
+        Removes a roast's contribution to its bean's usage (if it had one)
+        :param file: Path of the roast file
+        """
+        row = self._db.execute('SELECT beanId FROM roast_usage WHERE path = ?', (str(file),)).fetchone()
+        if row:
+            self._db.execute('DELETE FROM roast_usage WHERE path = ?', (str(file),))
+            self._dirty_beans.add(row[0])
+
+    def bean_usage(self) -> Dict[str, Tuple]:
+        """
+        The usage aggregates of every bean, recalculating only the beans whose roasts have changed
+        :return: dict of beanId -> (totalGreen, roastCount, firstRoasted, lastRoasted, avgLossPct)
+        """
+        if self._dirty_beans:
+            dirty = list(self._dirty_beans)
+            self._db.executemany('DELETE FROM bean_usage WHERE beanId = ?', ((bean_id,) for bean_id in dirty))
+            self._db.executemany('INSERT INTO bean_usage SELECT beanId, SUM(weightGreen), COUNT(*), MIN(dateTime), '
+                                 'MAX(dateTime), AVG(weightLossPct) FROM roast_usage WHERE beanId = ? GROUP BY beanId',
+                                 ((bean_id,) for bean_id in dirty))
+            self._dirty_beans.clear()
+        return {row[0]: row[1:] for row in self._db.execute('SELECT * FROM bean_usage')}
+
+    def get_annotation(self, file: Path) -> Union[Tuple[Dict, str], None]:
+        """
+        Fetches the parsed annotation file, as long as the file hasn't changed since it was cached
+        :param file: Path of the annotation file
+        :return: (frontmatter dict, content), or None if it isn't cached (or is stale)
+        """
+        row = self._db.execute('SELECT mtime, size, metadata, content FROM annotations WHERE path = ?',
+                               (str(file),)).fetchone()
+        if row is None or tuple(row[:2]) != self.file_key(file):
+            return None
+        return json.loads(row[2]), row[3]
+
+    def put_annotation(self, file: Path, metadata: Dict, content: str) -> None:
+        """
+        Stores a parsed annotation file, keyed by its current mtime and size
+        :param file: Path of the annotation file
+        :param metadata: JSON-able dict of the frontmatter
+        :param content: the markdown content
+        """
+        mtime, size = self.file_key(file)
+        self._db.execute('INSERT OR REPLACE INTO annotations (path, mtime, size, metadata, content) '
+                         'VALUES (?, ?, ?, ?, ?)', (str(file), mtime, size, json.dumps(metadata), content))
+
+    def commit(self) -> None:
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.db_file}, {len(self._rows)} files)"
@@ -0,0 +1,535 @@
+"""
+Catalog.
+A single pass, in-memory index of all the roast and bean files in the RoasTime directory, so that searching and
+loading Roasts and Beans doesn't mean re-reading the whole directory for every object.
+The header fields of each file are kept in a persistent cache, so only the files that changed get parsed again.
+"""
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple
+
+from .cache import CatalogCache
+from .config import config
+from .jsonheader import parse_json_header, read_json_header
+from .prefetch import Prefetcher
+from .tracing import tracer
+from .utils import read_markdown
+
+# what a file that can't be parsed (eg one that is still being written, and is cut off mid-header) raises: bad or
+# truncated JSON, or a header that's missing the fields a roast is derived from
+PARSE_ERRORS = (ValueError, IndexError, TypeError, KeyError, json.JSONDecodeError)
+
+
+def read_header(file: Path, data: bytes = None) -> Dict:
+    """
+    Reads only the top level scalar fields of a RoasTime JSON file (the long sample arrays are skipped, not parsed)
+    :param file: Path to the JSON file
+    :param data: (optional) the contents of the file, if it has already been read
+    :return: dict of the scalar fields
+    """
+    if data is not None:
+        return parse_json_header(data.decode('utf-8'))
+    return read_json_header(file)
+
+
+def roast_header(file: Path, data: bytes = None) -> Dict:
+    """
+    Reads a roast file and derives the fields that Roast needs from it.
+    Forks and aberrantly named roasts are left underived, as they never become a Roast.
+    :param file: Path to the roast file
+    :param data: (optional) the contents of the file, if it has already been read
+    :return: dict of the scalar fields, plus the derived ones
+    """
+    header = read_header(file, data)
+    if header.get('isFork') == 1 or ' - ' not in (header.get('roastName') or ''):
+        return header
+    with tracer.span('derive'):
+        header['weightGreen'] = float(header.get('weightGreen'))
+        header['weightRoasted'] = float(header.get('weightRoasted'))
+        header['weightLossPct'] = (1.0 - header['weightRoasted'] / header['weightGreen']) * 100.0
+        header['totalRoastTime'] = float(header.get('totalRoastTime'))
+        rate = int(header.get('sampleRate'))
+        start_at = int(header.get('roastStartIndex'))
+        # number of samples since start divided by samples/second
+        header['roastTimeDrying'] = (int(header.get('indexYellowingStart')) - start_at) / rate
+        # from first crack to end of roast
+        header['roastTimeDevelopment'] = header['totalRoastTime'] - (int(header.get('indexFirstCrackStart')) / rate)
+        header['roastDVPct'] = header['roastTimeDevelopment'] / header['totalRoastTime'] * 100.0
+    return header
+
+
+def parse_roasts(files: List[Path]) -> List[Dict]:
+    """
+    Parse (and derive) a shard of roast files - the work done by each process when the catalog loads in parallel.
+    The headers are small dicts of scalars, so shipping them back to the parent process is cheap.
+    :param files: Paths of the roast files
+    :return: list of headers (see roast_header), in the same order as files
+    """
+    return [roast_header(file) for file in files]
+
+
+def batch_key(batch: str) -> str:
+    """
+    Normalise a batch number for lookups, so that '7', '07' and '007' are all the same batch
+    :param batch: batch number (as a string)
+    :return: normalised batch number
+    """
+    return str(batch).strip().lstrip('0') or '0'
+
+
+class TrigramIndex(object):
+    """
+    Case-insensitive substring index over short texts (names), using the set of 3 letter sequences in each text.
+    TrigramIndex.add() / remove() index and un-index a key's text
+    TrigramIndex.search() returns the keys whose text contains a fragment, in the order they were added
+    """
+
+    def __init__(self):
+        self._grams = dict()
+        self._texts = dict()
+        self._order = dict()
+        self._counter = 0
+
+    @staticmethod
+    def trigrams(text: str) -> Set[str]:
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, key: str, text: str) -> None:
+        self.remove(key)
+        folded = (text or '').casefold()
+        self._texts[key] = folded
+        self._order[key] = self._counter
+        self._counter += 1
+        for gram in self.trigrams(folded):
+            self._grams.setdefault(gram, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        folded = self._texts.pop(key, None)
+        if folded is None:
+            return
+        del self._order[key]
+        for gram in self.trigrams(folded):
+            self._grams[gram].discard(key)
+
+    def search(self, fragment: str) -> List[str]:
+        """
+        :param fragment: the (partial) text to search for
+        :return: list of keys whose text contains the fragment (ignoring case)
+        """
+        folded = fragment.casefold()
+        grams = self.trigrams(folded)
+        if grams:
+            # only the keys that have every trigram of the fragment can contain it - start from the rarest trigram
+            postings = sorted((self._grams.get(gram, set()) for gram in grams), key=len)
+            candidates = set.intersection(*postings)
+        else:
+            candidates = self._texts.keys()
+        matches = [key for key in candidates if folded in self._texts[key]]
+        return sorted(matches, key=self._order.get)
+
+    def __len__(self):
+        return len(self._texts)
+
+
+@dataclass
+class RoastEntry:
+    """
+    Catalog entry for one roast file
+    """
+    roastId: str
+    path: Path
+    beanId: str = ''
+    name: str = ''
+    batch: str = ''
+    isFork: bool = False
+    header: dict = None
+
+    @property
+    def is_aberrant(self) -> bool:
+        """
+        True if the roast doesn't follow the "batch - name" naming convention (NOTE: peculiar to MY naming scheme)
+        """
+        return ' - ' not in (self.name or '')
+
+
+@dataclass
+class BeanEntry:
+    """
+    Catalog entry for one bean file
+    """
+    beanId: str
+    path: Path
+    name: str = ''
+    header: dict = None
+
+
+@dataclass
+class BeanUsage:
+    """
+    How much of a bean has been roasted
+    """
+    beanId: str
+    totalGreen: float = 0.0
+    roastCount: int = 0
+    firstRoasted: datetime = None
+    lastRoasted: datetime = None
+    avgLossPct: float = 0.0
+
+    @classmethod
+    def from_row(cls, bean_id: str, total_green: float, roast_count: int, first: int, last: int, avg_loss: float):
+        """
+        :return: BeanUsage from the aggregate values (dates as RoasTime timestamps, in ms)
+        """
+        return cls(bean_id, total_green, roast_count, datetime.fromtimestamp(first / 1000),
+                   datetime.fromtimestamp(last / 1000), avg_loss)
+
+
+@dataclass
+class BallisticsCatalog:
+    """
+    In-memory index of the roasts and beans directories:
+        roasts: roastId -> RoastEntry (beanId, name, batch, isFork flag)
+        beans: beanId -> BeanEntry
+        bean_roasts: beanId -> [roastId] (forks and aberrantly named roasts are not included)
+        batches: normalised batch number -> [roastId]
+        roast_names / bean_names: substring indexes over the roast and bean names
+    """
+    roasts: Dict[str, RoastEntry] = field(default_factory=dict)
+    beans: Dict[str, BeanEntry] = field(default_factory=dict)
+    bean_roasts: Dict[str, List[str]] = field(default_factory=dict)
+    batches: Dict[str, List[str]] = field(default_factory=dict)
+    roast_names: TrigramIndex = field(default_factory=TrigramIndex)
+    bean_names: TrigramIndex = field(default_factory=TrigramIndex)
+    initialized: bool = False
+    parsed: int = 0
+    cached: int = 0
+    load_time: float = 0.0
+    prefetch: Prefetcher = None
+    _cache: CatalogCache = None
+    _usage: Dict[str, BeanUsage] = None
+
+    def load(self, force: bool = False, workers: int = 1) -> None:
+        """
+        Indexes every file in the roasts and beans directories, parsing only those that aren't in the cache.
+        This is a one time deal - repeated attempts to load the catalog are skipped, unless explicitly forced
+        :param force: forces a reload of the catalog from disk
+        :param workers: (optional) number of processes to parse the roast files across, 1 parses them in-process
+        """
+        if self.initialized and not force:
+            return
+        if not config.initialized:
+            config.init_env()
+
+        with tracer.span('catalog') as timer:
+            self.roasts = dict()
+            self.beans = dict()
+            self.bean_roasts = dict()
+            self.batches = dict()
+            self.roast_names = TrigramIndex()
+            self.bean_names = TrigramIndex()
+            self.parsed = 0
+            self._usage = None
+            self.cached = 0
+            self.prefetch = Prefetcher(config.ioWorkers)
+            if config.cacheFile:
+                self._cache = CatalogCache(config.cacheFile)
+            with tracer.span('beans'):
+                self._load_files(list(config.beans_dir.glob('*')), self.add_bean)
+            with tracer.span('roasts'):
+                self._load_files(list(config.roasts_dir.glob('*')), self.add_roast, workers)
+            if self._cache:
+                self._cache.prune()
+                self._cache.commit()
+            self.initialized = True
+            self.load_time = timer.stop()
+        start_type = 'warm' if self.parsed == 0 else 'cold' if self.cached == 0 else 'partial'
+        config.logger.info(f"Catalog loaded {len(self.roasts)} roasts and {len(self.beans)} beans in "
+                           f"{self.load_time:.2f}s ({start_type} start: {self.parsed} parsed, {self.cached} cached, "
+                           f"{self.prefetch.io_wait:.2f}s waiting on I/O, {self.prefetch.parse_time:.2f}s parsing)")
+
+    def _load_files(self, files: List[Path], add, workers: int = 1) -> None:
+        """
+        Add a directory's worth of files to the catalog, in order. Only the files that aren't cached need parsing:
+        either they're read ahead of the parser on the I/O threads, or (with more than one worker) the roast files are
+        split into shards that are parsed across a pool of processes.
+        """
+        stale = [file for file in files if not (self._cache and self._cache.is_current(file))]
+        if workers > 1 and len(stale) > 1:
+            parsed = iter(self._parse_parallel(stale, workers))
+            fetched = ((file, None, next(parsed)) for file in stale)
+        else:
+            fetched = ((file, data, None) for file, data in self.prefetch.read(stale))
+        stale = set(stale)
+        for file in files:
+            if file in stale:
+                add(*next(fetched))
+            else:
+                add(file)
+
+    def _parse_parallel(self, files: List[Path], workers: int) -> List[Dict]:
+        """
+        Parse roast files across a pool of processes. The shards are contiguous runs of files, and the results are
+        merged back in the same order, so the catalog comes out the same as a serial load.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        with self.prefetch.parsing(), tracer.span('parse_parallel', files=len(files), workers=workers):
+            size = max(1, -(-len(files) // (workers * 4)))
+            shards = [files[i:i + size] for i in range(0, len(files), size)]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                headers = [header for shard in pool.map(parse_roasts, shards) for header in shard]
+        config.logger.debug(f"Parsed {len(files)} roasts in {len(shards)} shards across {workers} processes")
+        return headers
+
+    def _header(self, file: Path, kind: str, reader, data: bytes = None, parsed: Dict = None) -> Dict:
+        """
+        Fetches the header of a file from the cache, or parses it (and caches it) if it's new or has changed.
+        A header that has already been parsed (eg by a worker process) just needs caching.
+        """
+        header = self._cache.get(file) if self._cache and parsed is None else None
+        if header is None:
+            header = parsed
+            if header is None:
+                with self.prefetch.parsing(), tracer.span('parse', item=file.name):
+                    header = reader(file, data)
+            self.parsed += 1
+            if self._cache:
+                self._cache.put(file, kind, header)
+                if kind == 'roast':
+                    self._update_usage(file, header)
+        else:
+            self.cached += 1
+        return header
+
+    def _update_usage(self, file: Path, header: Dict) -> None:
+        """
+        Keep the cached bean usage up to date with a (new or changed) roast. Forks and aberrant roasts don't count.
+        """
+        if 'weightLossPct' in header:
+            self._cache.put_usage(file, header.get('beanId'), header['weightGreen'], header.get('dateTime'),
+                                  header['weightLossPct'])
+        else:
+            self._cache.delete_usage(file)
+
+    def add_roast(self, file: Path, data: bytes = None, header: Dict = None) -> RoastEntry:
+        """
+        Index one roast file and add (or replace) its entry in the catalog
+        :param file: Path to the roast file
+        :param data: (optional) the contents of the file, if it has already been read
+        :param header: (optional) the file's header, if it has already been parsed
+        :return: the catalog entry
+        """
+        header = self._header(file, 'roast', roast_header, data, header)
+        entry = RoastEntry(roastId=file.name, path=file, beanId=header.get('beanId'), name=header.get('roastName'),
+                           isFork=header.get('isFork') == 1, header=header)
+        if not entry.is_aberrant:
+            entry.batch = entry.name.split(' - ')[0]
+        self.remove_roast(entry.roastId)
+        self.roasts[entry.roastId] = entry
+        self._usage = None
+        if not entry.isFork and not entry.is_aberrant:
+            self.bean_roasts.setdefault(entry.beanId, list()).append(entry.roastId)
+            self.batches.setdefault(batch_key(entry.batch), list()).append(entry.roastId)
+            self.roast_names.add(entry.roastId, entry.name)
+        return entry
+
+    def remove_roast(self, roast_id: str) -> None:
+        """
+        Take a roast out of the catalog (and its indexes), eg if its file has been deleted or is about to be re-read
+        :param roast_id: the roastId to remove
+        """
+        entry = self.roasts.pop(roast_id, None)
+        if entry is None:
+            return
+        self._usage = None
+        for index, key in ((self.bean_roasts, entry.beanId), (self.batches, batch_key(entry.batch))):
+            if roast_id in index.get(key, list()):
+                index[key].remove(roast_id)
+                if not index[key]:
+                    # so a bean with no roasts left doesn't show up as used
+                    del index[key]
+        self.roast_names.remove(roast_id)
+
+    def add_bean(self, file: Path, data: bytes = None, header: Dict = None) -> BeanEntry:
+        """
+        Index one bean file and add (or replace) its entry in the catalog
+        :param file: Path to the bean file
+        :param data: (optional) the contents of the file, if it has already been read
+        :param header: (optional) the file's header, if it has already been parsed
+        :return: the catalog entry
+        """
+        header = self._header(file, 'bean', read_header, data, header)
+        entry = BeanEntry(beanId=file.name, path=file, name=header.get('name'), header=header)
+        self.beans[entry.beanId] = entry
+        self.bean_names.add(entry.beanId, entry.name)
+        return entry
+
+    def remove_bean(self, bean_id: str) -> None:
+        """
+        Take a bean out of the catalog (and its indexes)
+        :param bean_id: the beanId to remove
+        """
+        if self.beans.pop(bean_id, None):
+            self.bean_names.remove(bean_id)
+
+    def refresh(self, files: Iterable[Path]) -> Tuple[Set[str], Set[str]]:
+        """
+        Bring the catalog up to date with roast and bean files that have been added, changed or deleted since it was
+        loaded (eg as reported by a Watcher). Other files are ignored, and so are files that can't be parsed (yet) -
+        a file that is still being written is picked up again when it next changes.
+        :param files: Paths of the files that changed
+        :return: (roastIds, beanIds) - the roasts that changed, and the beans that changed or whose roasts did
+        """
+        self.load()
+        roast_ids = set()
+        bean_ids = set()
+        for file in files:
+            if file.parent == config.roasts_dir:
+                old = self.roasts.get(file.name)
+                if old:
+                    bean_ids.add(old.beanId)
+                if file.exists():
+                    try:
+                        bean_ids.add(self.add_roast(file).beanId)
+                    except PARSE_ERRORS as e:
+                        config.logger.warning(f"Skipped roast file {file}, it can't be parsed (yet): "
+                                              f"{e.__class__.__name__}: {e}")
+                        continue
+                else:
+                    self.remove_roast(file.name)
+                    if self._cache:
+                        self._cache.delete(file)
+                roast_ids.add(file.name)
+            elif file.parent == config.beans_dir:
+                if file.exists():
+                    try:
+                        self.add_bean(file)
+                    except PARSE_ERRORS as e:
+                        config.logger.warning(f"Skipped bean file {file}, it can't be parsed (yet): "
+                                              f"{e.__class__.__name__}: {e}")
+                        continue
+                else:
+                    self.remove_bean(file.name)
+                    if self._cache:
+                        self._cache.delete(file)
+                bean_ids.add(file.name)
+        if self._cache:
+            self._cache.commit()
+        return roast_ids, bean_ids
+
+    def roast(self, roast_id: str) -> RoastEntry:
+        """
+        Look up a roast by roastId, reading the file directly if it isn't (yet) in the catalog
+        :param roast_id: the roastId (file name) of the roast
+        :return: the catalog entry
+        """
+        self.load()
+        entry = self.roasts.get(roast_id)
+        if entry is None:
+            entry = self.add_roast(config.roasts_dir / roast_id)
+        return entry
+
+    def bean(self, bean_id: str) -> BeanEntry:
+        """
+        Look up a bean by beanId, reading the file directly if it isn't (yet) in the catalog
+        :param bean_id: the beanId (file name) of the bean
+        :return: the catalog entry
+        """
+        self.load()
+        entry = self.beans.get(bean_id)
+        if entry is None:
+            entry = self.add_bean(config.beans_dir / bean_id)
+        return entry
+
+    def roasts_for_bean(self, bean_id: str) -> List[str]:
+        """
+        :param bean_id: the beanId to look up
+        :return: list of roastIds made with that bean
+        """
+        self.load()
+        return list(self.bean_roasts.get(bean_id, list()))
+
+    def find_batch(self, batch: str) -> List[RoastEntry]:
+        """
+        Exact lookup of a batch number ('7' finds batch 007, but not 17 or 70)
+        :param batch: the batch number
+        :return: list of matching roasts (normally just the one)
+        """
+        self.load()
+        return [self.roasts[roast_id] for roast_id in self.batches.get(batch_key(batch), list())]
+
+    def search_roasts(self, fragment: str) -> List[RoastEntry]:
+        """
+        Find the roasts whose name contains a fragment (ignoring case). Forks and aberrant roasts aren't indexed.
+        :param fragment: the (partial) name to search for
+        :return: list of matching roasts
+        """
+        self.load()
+        return [self.roasts[roast_id] for roast_id in self.roast_names.search(fragment)]
+
+    def search_beans(self, fragment: str) -> List[BeanEntry]:
+        """
+        Find the beans whose name contains a fragment (ignoring case)
+        :param fragment: the (partial) name to search for
+        :return: list of matching beans
+        """
+        self.load()
+        return [self.beans[bean_id] for bean_id in self.bean_names.search(fragment)]
+
+    def annotation(self, file: Path) -> Tuple[Dict, str]:
+        """
+        The frontmatter and content of an annotation file, parsed once and then cached (across runs, with the cache)
+        until the file changes. Frontmatter values are kept as the strings they're published as.
+        Newly parsed annotations are written to the cache in one go by save() (or the next refresh()).
+        :param file: Path to the annotation markdown file
+        :return: (frontmatter dict, content)
+        """
+        self.load()
+        cached = self._cache.get_annotation(file) if self._cache else None
+        if cached is not None:
+            return cached
+        metadata, content = read_markdown(file)
+        metadata = {key: str(value) for key, value in metadata.items()}
+        if self._cache:
+            self._cache.put_annotation(file, metadata, content)
+        return metadata, content
+
+    def save(self) -> None:
+        """
+        Commit whatever has been added to the cache since the catalog was loaded (or last saved/refreshed), such as
+        newly parsed annotations
+        """
+        if self._cache:
+            self._cache.commit()
+
+    def bean_usage(self) -> Dict[str, BeanUsage]:
+        """
+        Usage aggregates (total green weight, roast count, first/last roast dates, average loss) of every bean that
+        has been roasted. They're worked out once, and again only after a roast is added or removed - with the cache,
+        only for the beans whose roasts have changed. The dict is shared, so don't modify it.
+        :return: dict of beanId -> BeanUsage
+        """
+        self.load()
+        if self._usage is not None:
+            return self._usage
+        if self._cache:
+            self._usage = {bean_id: BeanUsage.from_row(bean_id, *row)
+                           for bean_id, row in self._cache.bean_usage().items()}
+            self._cache.commit()
+            return self._usage
+        usage = dict()
+        for bean_id, roast_ids in self.bean_roasts.items():
+            headers = [self.roasts[roast_id].header for roast_id in roast_ids]
+            dates = [header.get('dateTime') for header in headers]
+            usage[bean_id] = BeanUsage.from_row(bean_id, sum(header['weightGreen'] for header in headers),
+                                                len(headers), min(dates), max(dates),
+                                                sum(header['weightLossPct'] for header in headers) / len(headers))
+        self._usage = usage
+        return usage
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self.roasts)} roasts, {len(self.beans)} beans)"
+
+
+catalog = BallisticsCatalog()
@@ -8,10 +8,9 @@ from dataclasses import dataclass
 # from typing import List
 from dotenv import load_dotenv
 from pathlib import Path
-from PIL import Image, ImageFont, ImageDraw
-from qrcode import QRCode
 
-from .utils import get_from_env
+from .utils import get_from_env, FontSpec, Layout
+from .qrcache import qr_cache
 
 
 @dataclass
@@ -41,7 +40,19 @@ class BallisticsConfig:
     outputDir: Path = Path('.')
     publishDir: Path = Path('.')
     annotationsDir: Path = None
+    cacheFile: Path = None
+    manifestFile: Path = None
+    traceFile: Path = None
+    archiveFile: Path = None
+    curveStoreFile: Path = None
+    labelWorkers: int = 1
+    ioWorkers: int = 4
+    parseWorkers: int = 1
+    watchSettle: float = 2.0
+    watchPoll: float = 1.0
+    qrCacheDir: Path = None
     labels: dict = None
+    graphs: dict = None
 
     def init_env(self, name: str = None, force: bool = False) -> None:
         """
@@ -73,21 +84,52 @@ class BallisticsConfig:
         self.outputDir = (Path(f"~{os.getenv('BULLET_USER', '')}").expanduser() / os.getenv('BALL_OUTPUT_DIR', '')) or self.outputDir
         self.annotationsDir = (Path(f"~{os.getenv('BULLET_USER', '')}").expanduser() / os.getenv('BALL_ANNOTATIONS_DIR', '')) or self.annotationsDir
         self.publishDir = (Path(f"~{os.getenv('BULLET_USER', '')}").expanduser() / os.getenv('BALL_PUBLISH_DIR', '')) or self.publishDir
+        # persistent header cache, set BALL_NO_CACHE to re-parse everything on every run
+        self.cacheFile = get_from_env('BALL_CACHE_FILE') or self.outputDir / '.ballistics-cache.sqlite'
+        if get_from_env('BALL_NO_CACHE'):
+            self.cacheFile = None
+        # columnar export of every roast, header fields and curves
+        self.archiveFile = get_from_env('BALL_ARCHIVE_FILE') or self.outputDir / 'roasts.npz'
+        # memory-mapped store of every roast's curves
+        self.curveStoreFile = get_from_env('BALL_CURVE_STORE_FILE') or self.outputDir / 'curves.f32'
+        # record of the inputs that went into each output, for incremental builds
+        self.manifestFile = get_from_env('BALL_MANIFEST_FILE') or self.outputDir / '.ballistics-manifest.json'
+        # Chrome trace of the timing spans of the last run
+        self.traceFile = get_from_env('BALL_TRACE_FILE') or self.outputDir / 'trace.json'
         self.baseUrl = os.getenv('BALL_BASE_URL', '') or self.baseUrl
         self.bestDaysStart = os.getenv('BALL_MIN_DAYS', '') or self.bestDaysStart
         self.bestDaysEnd = (os.getenv('BALL_MIN_DAYS', '') or self.bestDaysEnd) + self.bestDaysStart
+        self.labelWorkers = get_from_env('BALL_LABEL_WORKERS') or os.cpu_count() or 1
+        self.ioWorkers = get_from_env('BALL_IO_WORKERS') or self.ioWorkers
+        self.parseWorkers = get_from_env('BALL_PARSE_WORKERS') or os.cpu_count() or 1
+        # --watch: seconds a file has to be left alone before it's processed, and between polls (without inotify)
+        self.watchSettle = float(get_from_env('BALL_WATCH_SETTLE') or self.watchSettle)
+        self.watchPoll = float(get_from_env('BALL_WATCH_POLL') or self.watchPoll)
+        # QR codes are cached on disk between runs, set BALL_NO_CACHE to skip this too
+        self.qrCacheDir = get_from_env('BALL_QR_CACHE_DIR') or self.outputDir / '.qr-cache'
+        if get_from_env('BALL_NO_CACHE'):
+            self.qrCacheDir = None
+        qr_cache.cache_dir = self.qrCacheDir
+        # the fonts are loaded when a label or graph is first drawn
         self.labels = dict()
-        self.labels['large'] = {
+        self.labels['large'] = Layout({
             'width': 406,  # 2", @ 203 DPI
             'height': 609,  # 3", @ 203 DPI
-            'font_batch': ImageFont.truetype('Menlo', 48),
-            'font_title': ImageFont.truetype('Menlo', 36),
-            'font_origin': ImageFont.truetype('Arial', 38),
-            'font_small': ImageFont.truetype('Arial', 24),
+            'font_batch': FontSpec('Menlo', 48),
+            'font_title': FontSpec('Menlo', 36),
+            'font_origin': FontSpec('Arial', 38),
+            'font_small': FontSpec('Arial', 24),
             'line_length': 18,
             'line_count': 2,
 
-        }
+        })
+        self.graphs = dict()
+        self.graphs['profile'] = Layout({
+            'width': 900,
+            'height': 450,
+            'margin': 40,
+            'font': FontSpec('Arial', 14),
+        })
 
         # general utility section
         if name:
@@ -0,0 +1,43 @@
+"""
+Curves.
+The time-series sample arrays from a RoasTime roast file (temperatures and rates of rise), held as compact float32
+arrays rather than lists of Python floats.
+"""
+import json
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+# the sample arrays in a roast file, all sampled at the roast's sampleRate
+CURVE_NAMES = ('beanTemperature', 'drumTemperature', 'exitTemperature', 'beanDerivative', 'ibtsDerivative')
+
+
+def read_curves(file: Path) -> Dict[str, np.ndarray]:
+    """
+    Reads the sample arrays from a roast file
+    :param file: Path to the roast file
+    :return: dict of curve name -> float32 array (missing curves are empty arrays)
+    """
+    with open(file) as json_file:
+        raw = json.load(json_file)
+    return {name: np.asarray(raw.get(name) or [], dtype=np.float32) for name in CURVE_NAMES}
+
+
+def minmax_downsample(values: np.ndarray, buckets: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Downsample a curve to (at most) 2 points per bucket - the min and max of each bucket, in their original order.
+    This keeps the peaks and troughs of the curve, so it looks the same when drawn at one bucket per pixel.
+    :param values: the curve
+    :param buckets: number of buckets (ie, the pixel width it'll be drawn at)
+    :return: (sample indices, values at those indices)
+    """
+    count = len(values)
+    if count <= 2 * buckets:
+        return np.arange(count), values
+    size = -(-count // buckets)  # ceiling division
+    padded = np.pad(values, (0, size * buckets - count), mode='edge').reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    picks = np.sort(np.stack((padded.argmin(axis=1), padded.argmax(axis=1)), axis=1), axis=1) + offsets[:, None]
+    indices = np.minimum(picks.ravel(), count - 1)
+    return indices, values[indices]
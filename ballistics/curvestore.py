@@ -0,0 +1,160 @@
+"""
+Curve store.
+A binary file of float32 samples holding the curves of every roast, with an index of where each roast's curves are.
+The file is memory-mapped, so reading a roast's curves is a zero-copy slice, and any number of processes share the
+same pages. It's built (and appended to) from the roast files in config.roasts_dir.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Union
+
+import numpy as np
+
+from .catalog import catalog, RoastEntry
+from .config import config
+from .curves import CURVE_NAMES, read_curves
+from .utils import Stopwatch
+
+DTYPE = np.dtype('<f4')
+
+
+class CurveStore(object):
+    """
+    Memory-mapped store of roast curves.
+    Each roast is one block of its len(CURVE_NAMES) curves, back to back at their own lengths; the index (a JSON file
+    next to the data file) maps roastId -> offset and the length of each curve (in samples), plus the mtime and size of
+    the roast file the block was built from, so stale blocks are never served. A curve comes back exactly as
+    read_curves() reads it: a missing curve is an empty array, and a short one isn't padded.
+    CurveStore.curves() returns the curves of one roast as views into the mapped file
+    CurveStore.update() appends the roasts that are new or have changed since they were stored
+    CurveStore.rebuild() rewrites the whole store from scratch (dropping the blocks of changed or deleted roasts)
+    """
+
+    def __init__(self, data_file: Path = None):
+        self.data_file = data_file
+        self.index = dict()
+        self._data = None
+        self.initialized = False
+
+    @property
+    def index_file(self) -> Path:
+        return self.data_file.with_suffix('.idx.json')
+
+    def open(self, force: bool = False) -> None:
+        """
+        Load the index and map the data file (if they exist). Repeated attempts are skipped, unless forced
+        :param force: re-open the store, eg after another process has updated it
+        """
+        if self.initialized and not force:
+            return
+        if self.data_file is None:
+            if not config.initialized:
+                config.init_env()
+            self.data_file = config.curveStoreFile
+        self.data_file = Path(self.data_file)
+        self.index = dict()
+        self._data = None
+        if self.index_file.exists() and self.data_file.exists():
+            with open(self.index_file) as idxf:
+                self.index = json.load(idxf)
+            if self.data_file.stat().st_size:
+                self._data = np.memmap(self.data_file, dtype=DTYPE, mode='r')
+        self.initialized = True
+
+    def curves(self, roast_id: str, roast_file: Path = None) -> Union[Dict[str, np.ndarray], None]:
+        """
+        The curves of a roast, straight out of the mapped file (read only, no copies)
+        :param roast_id: the roastId to look up
+        :param roast_file: (optional) the roast's file - if given, its curves are only returned if it hasn't changed
+        :return: dict of curve name -> sample array, or None if the roast isn't in the store (or is stale)
+        """
+        self.open()
+        block = self.index.get(roast_id)
+        if block is None or self._data is None or 'lengths' not in block:
+            return None
+        if roast_file is not None and not self._is_current(block, roast_file):
+            return None
+        curves = dict()
+        offset = block['offset']
+        for name, length in zip(CURVE_NAMES, block['lengths']):
+            curves[name] = self._data[offset:offset + length]
+            offset += length
+        return curves
+
+    @staticmethod
+    def _is_current(block: Dict, roast_file: Path) -> bool:
+        # blocks stored before the curve lengths were recorded (padded to the longest curve) are rebuilt
+        if 'lengths' not in block:
+            return False
+        stat = roast_file.stat()
+        return block['mtime'] == stat.st_mtime_ns and block['size'] == stat.st_size
+
+    def update(self, entries: Iterable[RoastEntry] = None) -> int:
+        """
+        Append the curves of every roast that isn't in the store yet, or has changed since it was stored
+        :param entries: (optional) catalog entries to store, defaults to every roast in the catalog
+        :return: the number of roasts appended
+        """
+        self.open()
+        timer = Stopwatch()
+        if entries is None:
+            catalog.load()
+            entries = catalog.roasts.values()
+        stale = [entry for entry in entries if not entry.isFork and not entry.is_aberrant and
+                 (entry.roastId not in self.index or not self._is_current(self.index[entry.roastId], entry.path))]
+        if not stale:
+            return 0
+        if not self.data_file.parent.exists():
+            self.data_file.parent.mkdir(parents=True)
+        offset = self.data_file.stat().st_size // DTYPE.itemsize if self.data_file.exists() else 0
+        with open(self.data_file, 'ab') as dataf:
+            for entry in stale:
+                stat = entry.path.stat()
+                curves = read_curves(entry.path)
+                block = np.concatenate([curves[name] for name in CURVE_NAMES]).astype(DTYPE, copy=False)
+                dataf.write(block.tobytes())
+                self.index[entry.roastId] = {'offset': offset, 'lengths': [len(curves[name]) for name in CURVE_NAMES],
+                                             'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+                offset += block.size
+        self._save_index()
+        self.open(force=True)
+        config.logger.info(f"Appended {len(stale)} roasts to the curve store {self.data_file} in {timer.stop():.2f}s")
+        return len(stale)
+
+    def rebuild(self, entries: Iterable[RoastEntry] = None) -> int:
+        """
+        Rewrite the store from scratch, compacting away any replaced or deleted roasts
+        :param entries: (optional) catalog entries to store, defaults to every roast in the catalog
+        :return: the number of roasts stored
+        """
+        self.open()
+        old_data, old_index = self.data_file, self.index_file
+        self.data_file = self.data_file.with_name(f".{self.data_file.name}.tmp")
+        self.index = dict()
+        self._data = None
+        self.initialized = True
+        for tmp_file in (self.data_file, self.index_file):
+            tmp_file.unlink(missing_ok=True)
+        count = self.update(entries)
+        if not self.data_file.exists():
+            self.data_file.touch()
+            self._save_index()
+        # swap the new files in (processes with the old file mapped keep reading the old one)
+        os.replace(self.data_file, old_data)
+        os.replace(self.index_file, old_index)
+        self.data_file = old_data
+        self.open(force=True)
+        return count
+
+    def _save_index(self) -> None:
+        tmp_file = self.index_file.with_name(f".{self.index_file.name}.tmp")
+        with open(tmp_file, 'w') as idxf:
+            json.dump(self.index, idxf)
+        os.replace(tmp_file, self.index_file)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.data_file}, {len(self.index)} roasts)"
+
+
+curve_store = CurveStore()
@@ -0,0 +1,91 @@
+"""
+JSON header reader.
+Pulls the top level scalar fields out of a RoasTime JSON file without building the (long) sample arrays - arrays
+and objects are skipped over by scanning for their closing bracket, rather than being parsed.
+"""
+import json
+import re
+from json.decoder import scanstring
+from pathlib import Path
+from typing import Dict
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+# the only characters that matter when skipping over an array or object
+_structure = re.compile(r'[\[\]{}"]')
+
+
+def _skip_container(text: str, idx: int) -> int:
+    """
+    Skip over the array or object that starts at text[idx]
+    :param text: JSON text
+    :param idx: index of the opening [ or {
+    :return: index just past the matching closing bracket
+    """
+    depth = 0
+    while True:
+        match = _structure.search(text, idx)
+        if match is None:
+            raise ValueError(f"Unterminated array or object at {idx}")
+        char = match.group()
+        idx = match.end()
+        if char == '"':
+            # jump over the string, so brackets inside it aren't counted
+            _, idx = scanstring(text, idx)
+        elif char in '[{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return idx
+
+
+def _char(text: str, idx: int) -> str:
+    """
+    :return: the character at text[idx]
+    :raises ValueError: if the text ends before idx (eg a file that's still being written)
+    """
+    if idx >= len(text):
+        raise ValueError('Unexpected end of JSON input')
+    return text[idx]
+
+
+def parse_json_header(text: str) -> Dict:
+    """
+    Parse the top level scalar (string, number, bool, null) fields of a JSON object, skipping arrays and objects
+    :param text: JSON text of an object
+    :return: dict of the scalar fields
+    """
+    header = dict()
+    idx = _whitespace.match(text, 0).end()
+    if text[idx:idx + 1] != '{':
+        raise ValueError('Expected a JSON object')
+    idx += 1
+    while True:
+        idx = _whitespace.match(text, idx).end()
+        if _char(text, idx) == '}':
+            return header
+        if _char(text, idx) != '"':
+            raise ValueError(f"Expected a key at {idx}")
+        key, idx = scanstring(text, idx + 1)
+        idx = _whitespace.match(text, idx).end()
+        if _char(text, idx) != ':':
+            raise ValueError(f"Expected ':' at {idx}")
+        idx = _whitespace.match(text, idx + 1).end()
+        if _char(text, idx) in '[{':
+            idx = _skip_container(text, idx)
+        else:
+            header[key], idx = _decoder.raw_decode(text, idx)
+        idx = _whitespace.match(text, idx).end()
+        if _char(text, idx) == ',':
+            idx += 1
+
+
+def read_json_header(file: Path) -> Dict:
+    """
+    Reads the top level scalar fields of a JSON file, without parsing any arrays or objects
+    :param file: Path to the JSON file
+    :return: dict of the scalar fields
+    """
+    with open(file) as json_file:
+        return parse_json_header(json_file.read())
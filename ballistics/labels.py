@@ -0,0 +1,93 @@
+"""
+Labels.
+Rendering labels in bulk - each label is described by a (picklable) LabelSpec, so they can be rendered and saved
+across a pool of processes rather than one at a time on the main thread.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List
+
+from .config import config
+from .tracing import tracer
+from .utils import generate_large_label, save_image, Stopwatch
+
+
+@dataclass(frozen=True)
+class LabelSpec:
+    """
+    Everything needed to render and save one label
+    """
+    output: Path
+    batch: str
+    name: str
+    url: str
+    isDecaf: bool
+    roastDate: datetime
+    startDate: datetime
+    endDate: datetime
+    country: str
+    size: str = 'large'
+
+
+@dataclass
+class LabelResult:
+    """
+    The outcome of rendering one label: how long it took, and the error message if it failed
+    """
+    output: Path
+    seconds: float = 0.0
+    error: str = ''
+
+    @property
+    def ok(self) -> bool:
+        return not self.error
+
+
+def render_label(spec: LabelSpec) -> LabelResult:
+    """
+    Render one label and save it to its output path. Errors are caught and returned, rather than raised.
+    :param spec: the label to render
+    :return: LabelResult with the timing (and error, if any)
+    """
+    timer = Stopwatch()
+    try:
+        if not config.initialized:
+            config.init_env()
+        img = generate_large_label(config.labels[spec.size], spec.batch, spec.name, spec.url, spec.isDecaf,
+                                   spec.roastDate, spec.startDate, spec.endDate, spec.country, config.logger)
+        if not spec.output.parent.exists():
+            spec.output.parent.mkdir(parents=True, exist_ok=True)
+        save_image(img, spec.output)
+    except Exception as e:
+        return LabelResult(spec.output, timer.stop(), f"{e.__class__.__name__}: {e}")
+    return LabelResult(spec.output, timer.stop())
+
+
+def render_labels(specs: Iterable[LabelSpec], workers: int = None) -> List[LabelResult]:
+    """
+    Render and save a batch of labels across a pool of processes. A failed label doesn't abort the batch.
+    :param specs: the labels to render
+    :param workers: (optional) number of worker processes, defaults to config.labelWorkers. 1 renders in-process.
+    :return: list of LabelResults, in the same order as the specs
+    """
+    specs = list(specs)
+    if not config.initialized:
+        config.init_env()
+    workers = workers or config.labelWorkers
+    with tracer.span('labels', count=len(specs), workers=workers) as timer:
+        if workers <= 1 or len(specs) <= 1:
+            results = [render_label(spec) for spec in specs]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(render_label, specs, chunksize=max(1, len(specs) // (workers * 4))))
+        # each label was timed where it was rendered (maybe in a worker process)
+        for result in results:
+            tracer.add('label', result.seconds, item=result.output.name)
+    failures = [result for result in results if not result.ok]
+    for result in failures:
+        config.logger.error(f"Failed to render label {result.output}: {result.error}")
+    config.logger.info(f"Rendered {len(results) - len(failures)} of {len(specs)} labels in "
+                       f"{timer.time(running_total=True):.2f}s using {workers} workers")
+    return results
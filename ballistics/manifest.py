@@ -0,0 +1,111 @@
+"""
+Manifest.
+Records a hash of the inputs that went into each generated output file, so an incremental build only needs to
+regenerate the outputs whose inputs have changed.
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Union
+
+
+def file_hash(file: Path) -> str:
+    """
+    :param file: Path of the file to hash
+    :return: sha256 hex digest of the file contents, or '' if the file doesn't exist
+    """
+    if not file.exists():
+        return ''
+    return hashlib.sha256(file.read_bytes()).hexdigest()
+
+
+def label_fingerprint(label_conf: dict) -> Dict:
+    """
+    Turns a label config into something that can be hashed - fonts are represented by their name and size (a
+    FontSpec, as given in the config, or the name, style and size of a loaded font)
+    :param label_conf: a config.labels entry
+    :return: JSON-able dict
+    """
+    results = dict()
+    for key, value in label_conf.items():
+        if hasattr(value, 'getname'):
+            value = [*value.getname(), value.size]
+        results[key] = value
+    return results
+
+
+class BuildManifest(object):
+    """
+    A JSON file mapping each output path to the digest of the inputs it was generated from.
+    BuildManifest.digest() builds the digest for a set of input files and values
+    BuildManifest.is_current() checks if an output exists and was built from the same inputs
+    BuildManifest.record() records the inputs an output was (re)built from
+    BuildManifest.save() writes the manifest back to disk
+    """
+
+    def __init__(self, manifest_file: Path):
+        self.manifest_file = Path(manifest_file)
+        self.outputs = dict()
+        self.hashes = dict()
+        if self.manifest_file.exists():
+            with open(self.manifest_file) as mf:
+                saved = json.load(mf)
+            self.outputs = saved.get('outputs', dict())
+            self.hashes = saved.get('hashes', dict())
+        self.skipped = 0
+        self.built = 0
+
+    def hash(self, file: Path) -> str:
+        """
+        Content hash of an input file, only re-read if its mtime or size has changed since it was last hashed
+        :param file: Path of the input file
+        :return: sha256 hex digest, or '' if the file doesn't exist
+        """
+        if not file.exists():
+            return ''
+        stat = file.stat()
+        cached = self.hashes.get(str(file))
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        digest = file_hash(file)
+        self.hashes[str(file)] = [stat.st_mtime_ns, stat.st_size, digest]
+        return digest
+
+    def digest(self, files: Iterable[Path] = (), values: Union[Dict, None] = None) -> str:
+        """
+        Combine the hashes of the input files and the (JSON-able) input values into a single digest
+        :param files: Paths of the input files (missing files are fine, they hash as '')
+        :param values: config values or anything else the output depends on
+        :return: sha256 hex digest
+        """
+        inputs = {str(file): self.hash(file) for file in files}
+        inputs['__values__'] = values or dict()
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+    def is_current(self, output: Path, digest: str) -> bool:
+        """
+        :param output: Path of the output file
+        :param digest: digest of the inputs the output would be built from now
+        :return: True if the output exists, and was last built from the same inputs
+        """
+        current = output.exists() and self.outputs.get(str(output)) == digest
+        if current:
+            self.skipped += 1
+        return current
+
+    def record(self, output: Path, digest: str) -> None:
+        """
+        :param output: Path of the output file that has just been built
+        :param digest: digest of the inputs it was built from
+        """
+        self.outputs[str(output)] = digest
+        self.built += 1
+
+    def save(self) -> None:
+        if not self.manifest_file.parent.exists():
+            self.manifest_file.parent.mkdir(parents=True)
+        with open(self.manifest_file, 'w') as mf:
+            json.dump({'outputs': self.outputs, 'hashes': self.hashes}, mf, indent=1, sort_keys=True)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self.outputs)} outputs, {self.built} built, {self.skipped} skipped)"
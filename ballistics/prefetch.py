@@ -0,0 +1,89 @@
+"""
+Prefetch.
+Reads files ahead of the parser on a small pool of threads, so that slow opens (eg files in a synced home directory
+that have to be fetched first) overlap with the parsing of the files before them. Files are still handed over in
+the order they were asked for.
+"""
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple
+
+
+def read_bytes(file: Path) -> bytes:
+    with open(file, 'rb') as f:
+        return f.read()
+
+
+class Prefetcher(object):
+    """
+    Bounded, in order, read-ahead of file contents.
+    Prefetcher.read() yields (file, bytes) for each file, in the order given, with up to window reads in flight
+    Prefetcher.parsing() is a context manager that adds the time spent in its block to parse_time
+    io_wait is the time the caller spent blocked waiting for a file's bytes, read_time the total time spent reading
+    (across all the threads), and parse_time the time spent parsing (as measured with parsing())
+    """
+
+    def __init__(self, workers: int = 4, window: int = None):
+        self.workers = max(int(workers or 1), 1)
+        self.window = window or self.workers * 2
+        self.files = 0
+        self.bytes = 0
+        self.io_wait = 0.0
+        self.read_time = 0.0
+        self.parse_time = 0.0
+
+    def _timed_read(self, file: Path) -> Tuple[bytes, float]:
+        start = time.perf_counter()
+        data = read_bytes(file)
+        return data, time.perf_counter() - start
+
+    def read(self, files: Iterable[Path]) -> Iterator[Tuple[Path, bytes]]:
+        """
+        Read the files ahead of the caller, on the thread pool (or inline, with a single worker)
+        :param files: Paths of the files to read
+        :return: iterator of (file, contents), in the same order as files
+        """
+        files = iter(files)
+        if self.workers == 1:
+            for file in files:
+                data, seconds = self._timed_read(file)
+                self._count(data, seconds, seconds)
+                yield file, data
+            return
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='prefetch') as pool:
+            pending = deque()
+            for file in files:
+                pending.append((file, pool.submit(self._timed_read, file)))
+                if len(pending) >= self.window:
+                    yield self._next(pending)
+            while pending:
+                yield self._next(pending)
+
+    def _next(self, pending: deque) -> Tuple[Path, bytes]:
+        file, future = pending.popleft()
+        start = time.perf_counter()
+        data, seconds = future.result()
+        self._count(data, seconds, time.perf_counter() - start)
+        return file, data
+
+    def _count(self, data: bytes, read_time: float, io_wait: float) -> None:
+        self.files += 1
+        self.bytes += len(data)
+        self.read_time += read_time
+        self.io_wait += io_wait
+
+    @contextmanager
+    def parsing(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.parse_time += time.perf_counter() - start
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}({self.files} files, {self.bytes / 1e6:.1f}MB, "
+                f"{self.io_wait:.2f}s I/O wait, {self.parse_time:.2f}s parsing)")
+
@@ -0,0 +1,109 @@
+"""
+QR code cache.
+Encoding and rasterising a QR code is the same work every time for the same URL, so the images are kept in memory
+(and optionally on disk, named by a hash of what went into them) and re-used between labels and between runs.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+class QRCache(object):
+    """
+    Least-recently-used cache of QR code images, keyed by (url, box_size, border, version).
+    QRCache.get() returns the QR code image, generating (and caching) it if needed
+    QRCache.clear() empties the in-memory cache (the disk cache is left alone)
+    If cache_dir is set, images are also saved there as PNGs, keeping at most max_files of the most recently used.
+    """
+
+    def __init__(self, cache_dir: Union[Path, None] = None, max_items: int = 512, max_files: int = 4096):
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self.max_files = max_files
+        self._images = OrderedDict()
+        self._file_count = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_name(key: Tuple) -> str:
+        """
+        :param key: (url, box_size, border, version)
+        :return: the content addressed file name for the key
+        """
+        return hashlib.sha256(repr(key).encode()).hexdigest() + '.png'
+
+    def get(self, url: str, box_size: int = 10, border: int = 1, version: int = 1) -> Image:
+        """
+        Fetches the QR code for a URL from memory, then disk, and only encodes it if it isn't in either.
+        The image is shared, so copy it before drawing on it.
+        :param url: the data to encode
+        :param box_size: pixels per QR box
+        :param border: border width, in boxes
+        :param version: QR code version (size)
+        :return: QR code image
+        """
+        key = (url, box_size, border, version)
+        img = self._images.get(key)
+        if img is not None:
+            self._images.move_to_end(key)
+            self.hits += 1
+            return img
+
+        cache_file = Path(self.cache_dir) / self.key_name(key) if self.cache_dir else None
+        if cache_file and cache_file.exists():
+            from PIL import Image
+            img = Image.open(cache_file)
+            img.load()
+            cache_file.touch()
+            self.hits += 1
+        else:
+            from qrcode import QRCode
+            qr = QRCode(box_size=box_size, border=border, version=version)
+            qr.add_data(url)
+            img = qr.make_image().get_image()
+            self.misses += 1
+            if cache_file:
+                self._save(cache_file, img)
+
+        self._images[key] = img
+        if len(self._images) > self.max_items:
+            self._images.popitem(last=False)
+        return img
+
+    def _save(self, cache_file: Path, img: Image) -> None:
+        """
+        Saves a QR code to the disk cache, evicting the least recently used files if the cache is full.
+        The image is written to a temporary file and renamed into place, so another process (eg a label worker) never
+        reads it half written.
+        """
+        if not cache_file.parent.exists():
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+        if self._file_count is None:
+            self._file_count = len(list(cache_file.parent.glob('*.png')))
+        # named per process, as the workers can all be saving the same QR code at once
+        tmp_file = cache_file.with_name(f".{cache_file.name}.{os.getpid()}.tmp")
+        img.save(tmp_file, format='PNG')
+        os.replace(tmp_file, cache_file)
+        self._file_count += 1
+        if self._file_count > self.max_files:
+            cached = sorted(cache_file.parent.glob('*.png'), key=lambda f: f.stat().st_mtime)
+            for old_file in cached[:len(cached) - self.max_files]:
+                old_file.unlink(missing_ok=True)
+            self._file_count = min(len(cached), self.max_files)
+
+    def clear(self) -> None:
+        self._images.clear()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self._images)} images, {self.hits} hits, {self.misses} misses)"
+
+
+qr_cache = QRCache()
@@ -0,0 +1,35 @@
+"""
+Reports.
+Summary reports across all the roasts and beans, built from the catalog (no Roast or Bean objects are loaded).
+"""
+from pathlib import Path
+
+from .catalog import catalog
+from .config import config
+from .utils import write_if_changed
+
+
+def bean_usage_report(output_file: Path = None) -> Path:
+    """
+    Write a markdown report of how much of each bean has been roasted, most recently roasted first
+    :param output_file: (optional) where to write the report, defaults to reports/bean-usage.md in the output directory
+    :return: Path of the report
+    """
+    catalog.load()
+    output_file = output_file or config.outputDir / "reports" / "bean-usage.md"
+    usage = sorted(catalog.bean_usage().values(), key=lambda u: u.lastRoasted, reverse=True)
+    lines = [
+        "# Bean usage",
+        "",
+        f"{sum(u.roastCount for u in usage)} roasts, {sum(u.totalGreen for u in usage) / 1000:.1f}kg of green beans",
+        "",
+        "| Bean | Roasts | Green (kg) | First roasted | Last roasted | Avg loss |",
+        "|------|-------:|-----------:|---------------|--------------|---------:|",
+    ]
+    for u in usage:
+        bean = catalog.beans.get(u.beanId)
+        name = bean.name.strip() if bean else u.beanId
+        lines.append(f"| {name} | {u.roastCount} | {u.totalGreen / 1000:.1f} | {u.firstRoasted.strftime('%D')} | "
+                     f"{u.lastRoasted.strftime('%D')} | {u.avgLossPct:.1f}% |")
+    write_if_changed(output_file, '\n'.join(lines) + '\n')
+    return output_file
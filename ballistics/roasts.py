@@ -7,36 +7,52 @@ import json
 import textwrap
 from pathlib import Path
 from pprint import pprint
-from typing import List, Dict
+from typing import List, Dict, NamedTuple
 from datetime import datetime, timedelta
-from PIL import Image, ImageFont, ImageDraw
-from qrcode import QRCode
 
 from .errors import ForeignRoastException
-from .utils import generate_large_label
+from .utils import generate_large_label, generate_profile_graph, save_image, write_if_changed
+from .labels import LabelSpec
 from .config import config
-from .beans import Bean, find_bean_by
+from .catalog import catalog, RoastEntry
+from .beans import Bean, BeanSummary, bean_registry, find_bean_by
 
 
 @dataclass
 class RoastCollection:
     """
-    Collection of Roasts
+    Collection of Roasts.
+    In parallel mode the roast files that aren't in the cache are parsed across a pool of processes (workers of them,
+    defaults to config.parseWorkers) - this only matters if the catalog hasn't been loaded yet.
+    In lightweight mode the collection holds RoastSummary records instead of full Roasts.
+    If roast_ids is given, the collection only holds those roasts (eg the ones that just changed).
     """
     # roasts: list
+    parallel: bool = False
+    workers: int = None
+    lightweight: bool = False
+    roast_ids: List[str] = None
 
     def __post_init__(self):
         self.roasts = list()
         if not config.initialized:
             config.init_env()
-        for file in config.roasts_dir.glob('*'):
-            config.logger.debug(f"Collection loading roast: {file.stem}")
+        catalog.load(workers=(self.workers or config.parseWorkers) if self.parallel else 1)
+        beans = dict()
+        for roast_id in list(catalog.roasts if self.roast_ids is None else self.roast_ids):
+            config.logger.debug(f"Collection loading roast: {roast_id}")
             try:
-                roast = Roast(file.stem)
+                if self.lightweight:
+                    entry = catalog.roast(roast_id)
+                    if entry.beanId not in beans:
+                        beans[entry.beanId] = BeanSummary.from_entry(catalog.bean(entry.beanId))
+                    roast = RoastSummary.from_entry(entry, beans[entry.beanId])
+                else:
+                    roast = Roast(roast_id)
                 if roast:
                     self.roasts.append(roast)
             except ForeignRoastException as e:
-                config.logger.debug(f"Encountered error creating Roast ({file.stem}, message = {e}")
+                config.logger.debug(f"Encountered error creating Roast ({roast_id}, message = {e}")
 
     def __iter__(self):
         # FIXME: this isn't working for some reason
@@ -76,50 +92,51 @@ class Roast:
     roastTimeTotal: float = 0.0
     roastDVPct: float = 0.0
     bean: Bean = None
-    raw: json = None
 
     def __post_init__(self):
         if not config.initialized:
             config.init_env()
-        with open(config.roasts_dir / self.roastId) as json_file:
-            self.raw = json.load(json_file)
-        self.beanId = self.raw.get('beanId')
-        roastname = self.raw.get('roastName')
+        entry = catalog.roast(self.roastId)
+        self.path = entry.path
+        self.header = entry.header
+        self._curves = None
+        self.beanId = entry.beanId
+        roastname = entry.name
 
         ################
         # Fatal error checking
         ################
         # This flag indicates a saved roast or other roast brought into RoasTime that wasn't actually roasted
-        if self.raw.get('isFork') == 1:
+        if entry.isFork:
             raise ForeignRoastException(f"Roast {self.roastId} is a recipe or borrowed roast profile")
         # we have found an abberant roast, and it either needs to be renamed (fixed in the source) or it needs
         # to be excluded from the data
-        if ' - ' not in roastname:
+        if entry.is_aberrant:
             config.logger.debug(f"Found an aberrantly named roast {roastname}")
             raise ForeignRoastException(f"Roast {self.roastId} aberrantly named as {roastname}")
         ################
 
         # split names into batch number and name
-        self.batch, self.name = self.raw.get('roastName').split(' - ')
+        self.batch, self.name = roastname.split(' - ')
 
         # local and remote URLs
         self.urlSite = f"/roasts/{self.batch}"
         self.url = config.baseUrl + self.urlSite
 
-        self.bean = Bean(self.beanId)
-        self.weightGreen = float(self.raw.get('weightGreen'))
-        self.weightRoasted = float(self.raw.get('weightRoasted'))
-        self.weightLossPct = (1.0 - self.weightRoasted / self.weightGreen)*100.0
-        self.roastDate = datetime.fromtimestamp(self.raw.get('dateTime') / 1000)
+        # one Bean is shared by all the roasts of that bean
+        self.bean = bean_registry.get(self.beanId)
+        # weights and times are derived (and cached) by the catalog
+        self.weightGreen = self.header['weightGreen']
+        self.weightRoasted = self.header['weightRoasted']
+        self.weightLossPct = self.header['weightLossPct']
+        self.roastDate = datetime.fromtimestamp(self.header.get('dateTime') / 1000)
         # enjoy between these two date
         self.roastBestDate = [self.roastDate + timedelta(days=config.bestDaysStart), self.roastDate + timedelta(days=config.bestDaysEnd)]
-        self.roastTimeTotal = float(self.raw.get('totalRoastTime'))
-        rate = int(self.raw.get('sampleRate'))
-        start_at = int(self.raw.get('roastStartIndex'))
-        self.roastTimeDrying = (int(self.raw.get('indexYellowingStart')) - start_at) / rate  # number of samples since start divided by samples/second
-        self.roastTimeDevelopment = self.roastTimeTotal - (int(self.raw.get('indexFirstCrackStart')) / rate)  # from first crack to end of roast
-        self.roastDVPct = self.roastTimeDevelopment / self.roastTimeTotal * 100.0
-        roast_degree = self.raw.get('roastDegree')
+        self.roastTimeTotal = self.header['totalRoastTime']
+        self.roastTimeDrying = self.header['roastTimeDrying']
+        self.roastTimeDevelopment = self.header['roastTimeDevelopment']
+        self.roastDVPct = self.header['roastDVPct']
+        roast_degree = self.header.get('roastDegree')
         if roast_degree:
             self.roastLevel = config.roastLevels[int(roast_degree)]
 
@@ -133,57 +150,53 @@ class Roast:
 
     def to_markdown(self) -> Path:
         """
-        Output the Roast as a markdown file.
+        Output the Roast as a markdown file. The file is only rewritten if its content has changed.
         :return: Path of the output file
         """
-        # output_beans_dir = config.outputDir / "beans"
-        output_roast_dir = config.outputDir / "roasts"
-        if not output_roast_dir.exists():
-            output_roast_dir.mkdir(parents=True)
-        output_file = output_roast_dir / f"{self.batch}.md"
-        with open(output_file, 'w') as roastf:
-            # write out the frontmatter
-            roastf.write("---\n")
-            roastf.write(f"title: {self.name}\n")
-            roastf.write(f"batch: {self.batch}\n")
-            roastf.write(f"origin: {self.country}\n")
-            roastf.write(f"roastedDate: {self.roastDate}\n")
-            roastf.write(f"bestDate: {self.roastBestDate[1]}\n")
-            roastf.write("type: roast\n")
-            roastf.write(f"path: {self.urlSite}\n")
-            roastf.write(f"beanPath: {self.bean.urlSite}\n")
-            roastf.write(f"beanName: {self.bean.name}\n")
-            roastf.write(f"region: {self.region}\n")
-            roastf.write(f"rwUrl: https://roast.world/my/roasts/{self.roastId}\n")
-            label = f"images/{self.batch}"
-            if (config.outputDir / f"roasts/{label}.png").exists():
-                # shit gets dicy if this doesn't exist
-                roastf.write(f"labelPic: {label}.png\n")
-            if (config.outputDir / f"roasts/{label}-profile.png").exists():
-                # queries fail if NO roasts have a profile graph
-                roastf.write(f"profilePic: {label}-profile.png\n")
-            profile = f"images/{self.batch}-profile.png"
-            roastf.write("tags:\n")
-            roastf.write(" - roastedby\n")
-            roastf.write(" - roast\n")
-            if self.isDecaf:
-                roastf.write(" - decaf\n")
-            if self.isOrganic:
-                roastf.write(" - organic\n")
-            if self.bean.isForEspresso:
-                roastf.write(" - espresso\n")
-            roastf.write("---\n")
-            # write out the semi-structured content
-            # TODO: add in details
-            roastf.write("### Roast details\n\n")
-            if self.roastLevel:
-                roastf.write(f"*Roast level:* {self.roastLevel}\n\n")
-            roastf.write(f"*Weight in:* {self.weightGreen}g\n\n")
-            roastf.write(f"*Weight out:* {self.weightRoasted}g\n\n")
-            roastf.write(f"*Roast time:* {(self.roastTimeTotal / 60):.1f} minutes\n\n")
-            roastf.write(f"*Development:* {self.roastDVPct:.1f}%\n\n")
-            roastf.write("\n")
-        roastf.close()
+        output_file = self.markdown_file
+        md = list()
+        # write out the frontmatter
+        md.append("---\n")
+        md.append(f"title: {self.name}\n")
+        md.append(f"batch: {self.batch}\n")
+        md.append(f"origin: {self.country}\n")
+        md.append(f"roastedDate: {self.roastDate}\n")
+        md.append(f"bestDate: {self.roastBestDate[1]}\n")
+        md.append("type: roast\n")
+        md.append(f"path: {self.urlSite}\n")
+        md.append(f"beanPath: {self.bean.urlSite}\n")
+        md.append(f"beanName: {self.bean.name}\n")
+        md.append(f"region: {self.region}\n")
+        md.append(f"rwUrl: https://roast.world/my/roasts/{self.roastId}\n")
+        label = f"images/{self.batch}"
+        if (config.outputDir / f"roasts/{label}.png").exists():
+            # shit gets dicy if this doesn't exist
+            md.append(f"labelPic: {label}.png\n")
+        if (config.outputDir / f"roasts/{label}-profile.png").exists():
+            # queries fail if NO roasts have a profile graph
+            md.append(f"profilePic: {label}-profile.png\n")
+        profile = f"images/{self.batch}-profile.png"
+        md.append("tags:\n")
+        md.append(" - roastedby\n")
+        md.append(" - roast\n")
+        if self.isDecaf:
+            md.append(" - decaf\n")
+        if self.isOrganic:
+            md.append(" - organic\n")
+        if self.bean.isForEspresso:
+            md.append(" - espresso\n")
+        md.append("---\n")
+        # write out the semi-structured content
+        # TODO: add in details
+        md.append("### Roast details\n\n")
+        if self.roastLevel:
+            md.append(f"*Roast level:* {self.roastLevel}\n\n")
+        md.append(f"*Weight in:* {self.weightGreen}g\n\n")
+        md.append(f"*Weight out:* {self.weightRoasted}g\n\n")
+        md.append(f"*Roast time:* {(self.roastTimeTotal / 60):.1f} minutes\n\n")
+        md.append(f"*Development:* {self.roastDVPct:.1f}%\n\n")
+        md.append("\n")
+        write_if_changed(output_file, ''.join(md))
         return output_file
 
     def generate_labels(self) -> None:
@@ -245,16 +258,97 @@ class Roast:
                                    self.roastBestDate[0], self.roastBestDate[1], self.country, config.logger)
 
         # save the image label file, in an iCloud location, so that I can print them as needed
-        img_file = f"{self.batch}.png"
-        img_loc = config.outputDir / "roasts/images"
-        if not img_loc.exists():
-            img_loc.mkdir(parents=True)
-        img.save(img_loc / img_file)
+        img_file = self.label_file
+        if not img_file.parent.exists():
+            img_file.parent.mkdir(parents=True)
+        save_image(img, img_file)
         # TODO: small label
         return
 
-    def generate_profile_graph(self):
-        pass
+    @property
+    def markdown_file(self) -> Path:
+        """
+        Path of the markdown file for this roast, in the output directory
+        """
+        return config.outputDir / "roasts" / f"{self.batch}.md"
+
+    @property
+    def label_file(self) -> Path:
+        """
+        Path of the (large) label image for this roast, in the output directory
+        """
+        return config.outputDir / "roasts/images" / f"{self.batch}.png"
+
+    @property
+    def profile_file(self) -> Path:
+        """
+        Path of the profile graph image for this roast, in the output directory
+        """
+        return config.outputDir / "roasts/images" / f"{self.batch}-profile.png"
+
+    @property
+    def raw(self) -> Dict:
+        """
+        A copy of the roast's header: the scalar fields of the JSON file from RoasTime, plus the ones the catalog
+        derives from them (weights, times). The sample arrays are in curves, and load_raw() reads the whole file.
+        """
+        # the header is shared with the catalog (and its cache), so it's never handed out to be modified
+        return dict(self.header)
+
+    @property
+    def curves(self) -> Dict:
+        """
+        The sample arrays (temperatures and rates of rise) as float32 arrays, loaded on first access - from the
+        memory-mapped curve store if the roast is in it (and up to date), otherwise from the JSON file.
+        Use release_curves() to free them again.
+        """
+        if self._curves is None:
+            # numpy is only imported when a roast's curves are first needed
+            from .curves import read_curves
+            from .curvestore import curve_store
+            self._curves = curve_store.curves(self.roastId, self.path) or read_curves(self.path)
+        return self._curves
+
+    def release_curves(self) -> None:
+        """
+        Drop the sample arrays from memory, they'll be re-read if curves is used again
+        """
+        self._curves = None
+
+    def load_raw(self) -> Dict:
+        """
+        Reads the full JSON file from RoasTime, including the sample arrays and actions. It isn't kept on the Roast.
+        :return: the parsed JSON
+        """
+        with open(self.path) as json_file:
+            return json.load(json_file)
+
+    def label_spec(self, size: str = 'large') -> LabelSpec:
+        """
+        Describe this roast's label, for rendering in bulk (see labels.render_labels)
+        :param size: which of config.labels to render
+        :return: LabelSpec
+        """
+        return LabelSpec(self.label_file, str(self.batch), self.name, self.url, self.isDecaf, self.roastDate,
+                         self.roastBestDate[0], self.roastBestDate[1], self.country, size)
+
+    def generate_profile_graph(self) -> Path:
+        """
+        Draw the roast profile graph (temperatures and rate of rise, with the roast events marked) and save it
+        :return: Path of the saved image
+        """
+        markers = {
+            'Start': self.header.get('roastStartIndex'),
+            'Yellowing': self.header.get('indexYellowingStart'),
+            'First crack': self.header.get('indexFirstCrackStart'),
+        }
+        img = generate_profile_graph(config.graphs['profile'], self.curves, float(self.header.get('sampleRate')),
+                                     markers, config.logger)
+        img_file = self.profile_file
+        if not img_file.parent.exists():
+            img_file.parent.mkdir(parents=True)
+        save_image(img, img_file)
+        return img_file
 
     def __repr__(self):
         return f"{self.__class__.__name__}({self.name}, Origin:{self.beanId})"
@@ -263,40 +357,83 @@ class Roast:
         return f"{self.__class__.__name__}({self.name})"
 
 
+class RoastSummary(NamedTuple):
+    """
+    Compact, immutable summary of a Roast: just the scalar fields (and a few of its Bean's), for listing, filtering
+    and reporting in bulk. It's a NamedTuple, so there's no per-instance __dict__, header or nested Bean.
+    to_roast() loads the full Roast.
+    """
+    roastId: str
+    batch: str
+    name: str
+    beanId: str
+    beanName: str
+    country: str
+    region: str
+    isDecaf: bool
+    isOrganic: bool
+    roastDate: datetime
+    roastLevel: str
+    weightGreen: float
+    weightRoasted: float
+    weightLossPct: float
+    roastTimeTotal: float
+    roastDVPct: float
+
+    @classmethod
+    def from_entry(cls, entry: RoastEntry, bean: BeanSummary = None) -> 'RoastSummary':
+        """
+        :param entry: the roast's catalog entry
+        :param bean: (optional) the summary of the roast's bean, looked up in the catalog if not given
+        :return: RoastSummary, with the same values a Roast would have
+        """
+        # the same roasts are excluded as when creating a Roast
+        if entry.isFork:
+            raise ForeignRoastException(f"Roast {entry.roastId} is a recipe or borrowed roast profile")
+        if entry.is_aberrant:
+            raise ForeignRoastException(f"Roast {entry.roastId} aberrantly named as {entry.name}")
+        bean = bean or BeanSummary.from_entry(catalog.bean(entry.beanId))
+        header = entry.header
+        batch, name = entry.name.split(' - ')
+        roast_degree = header.get('roastDegree')
+        return cls(roastId=entry.roastId, batch=batch, name=name, beanId=entry.beanId, beanName=bean.name,
+                   country=bean.country, region=bean.region, isDecaf=bean.isDecaf, isOrganic=bean.isOrganic,
+                   roastDate=datetime.fromtimestamp(header.get('dateTime') / 1000),
+                   roastLevel=config.roastLevels[int(roast_degree)] if roast_degree else '',
+                   weightGreen=header['weightGreen'], weightRoasted=header['weightRoasted'],
+                   weightLossPct=header['weightLossPct'], roastTimeTotal=header['totalRoastTime'],
+                   roastDVPct=header['roastDVPct'])
+
+    @property
+    def urlSite(self) -> str:
+        return f"/roasts/{self.batch}"
+
+    def to_roast(self) -> Roast:
+        """
+        :return: the full Roast
+        """
+        return Roast(self.roastId)
+
+
 def find_roast_by(search_val: str, method: str = 'name') -> Dict:
     """
-    Searches through the roasts repository to find all roast IDs that match a (partial) name provided
+    Searches the catalog's indexes to find all roast IDs that match a (partial) name provided.
+    Recipes/borrowed roasts (forks) and roasts that don't follow the "batch - name" naming scheme are never matched.
     :param search_val: the name (or fragment) of a roast to search for
-    :param method: (optional) 'name' or 'beanid' - match on the roast name, or the bean id
-    :return: dict of matching roasts: {name: [ID]}
+    :param method: (optional) 'name', 'batch' or 'beanid' - match on (part of) the roast name, the exact batch number,
+        or the bean id
+    :return: dict of matching roasts: {beanId: [ID]}
     """
     roasts = dict()
-    if not config.initialized:
-        config.init_env()
-
-    for file in config.roasts_dir.glob('*'):
-        config.logger.debug(f"Found roast: {file}")
-        with open(file) as json_file:
-            roastf = json.load(json_file)
-        rname = roastf.get('roastName')
-        roast_id = roastf.get('uid')
-        bean_id = roastf.get('beanId')
-        # filter out the roasts that aren't mine (NOTE: This is peculiar to MY naming scheme, YMMV
-        if roastf.get('isFork') == 1:
-            # This flag indicates a saved roast or other roast brought into RoasTime that wasn't actually roasted
-            continue
-        if ' - ' not in rname:
-            # this means it's a roast that doesn't follow my naming convention!
-            config.logger.debug(f"Found a roast naming scheme violation, roastID {roast_id}")
-            continue
-        # match on name
-        if method == 'beanid':
-            if search_val != bean_id:
-                continue
-        else:
-            if search_val.casefold() not in rname.casefold():
-                continue
-        if not roasts.get(bean_id):
-            roasts[bean_id] = list()
-        roasts[bean_id].append(roast_id)
+    if method == 'beanid':
+        matches = [catalog.roast(roast_id) for roast_id in catalog.roasts_for_bean(search_val)]
+    elif method == 'batch':
+        matches = catalog.find_batch(search_val)
+    else:
+        matches = catalog.search_roasts(search_val)
+    for entry in matches:
+        config.logger.debug(f"Found roast: {entry.path}")
+        if not roasts.get(entry.beanId):
+            roasts[entry.beanId] = list()
+        roasts[entry.beanId].append(entry.roastId)
     return roasts
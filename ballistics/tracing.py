@@ -0,0 +1,189 @@
+"""
+Tracing.
+Nested, named timing spans built on Stopwatch, so a run can show where its time goes: each span is timed on its own
+Stopwatch, and is recorded under its path (eg 'ingest/roasts/markdown'), with count, total, percentiles and the
+slowest item. Unusually slow items are logged as they happen. At the end of a run, tracer.summary() gives a table and
+tracer.write_chrome_trace() saves every span as a Chrome trace (open it in chrome://tracing or ui.perfetto.dev).
+"""
+import datetime
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+from .config import config
+from .utils import Stopwatch
+
+
+class Span(Stopwatch):
+    """
+    A Stopwatch with a name, the path of the spans it's nested in, and (optional) details such as the item it's for
+    """
+
+    def __init__(self, name: str, path: str, args: Dict = None):
+        super().__init__()
+        self.name = name
+        self.path = path
+        self.args = args or dict()
+        self.thread = threading.get_ident()
+
+    @property
+    def started(self):
+        return self._start_time
+
+
+class SpanStats(object):
+    """
+    Running statistics of all the spans with the same path
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self.total = 0.0
+        self.durations = list()
+        self.slowest = 0.0
+        self.slowest_item = None
+
+    def add(self, seconds: float, item=None) -> None:
+        self.count += 1
+        self.total += seconds
+        self.durations.append(seconds)
+        if seconds > self.slowest:
+            self.slowest = seconds
+            self.slowest_item = item
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct: float) -> float:
+        """
+        :param pct: percentile, 0 to 100
+        :return: the duration at that percentile (nearest rank)
+        """
+        if not self.durations:
+            return 0.0
+        ordered = sorted(self.durations)
+        return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+class Tracer(object):
+    """
+    Records nested timing spans.
+    Tracer.span() is a context manager that times its block as a span nested in whichever span is open (per thread)
+    Tracer.add() records a span that was timed elsewhere (eg in a worker process)
+    Tracer.summary() returns a table of the stats of every span path, in the order they first ran
+    Tracer.write_chrome_trace() saves every span in the Chrome trace event format
+    Spans that take more than slow_factor times the average of their path (and at least slow_min seconds) are logged.
+    """
+
+    def __init__(self, slow_factor: float = 5.0, slow_min: float = 0.05, min_count: int = 10,
+                 max_events: int = 200000):
+        self.slow_factor = slow_factor
+        self.slow_min = slow_min
+        self.min_count = min_count
+        self.max_events = max_events
+        self.stats = dict()
+        self.events = list()
+        self.epoch = datetime.datetime.now()
+        self._local = threading.local()
+
+    def _stack(self) -> List[Span]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = list()
+        return self._local.stack
+
+    def _path(self, name: str) -> str:
+        stack = self._stack()
+        return f"{stack[-1].path}/{name}" if stack else name
+
+    @contextmanager
+    def span(self, name: str, **args):
+        """
+        Time the block as a span called name, nested in the current span
+        :param name: name of the span
+        :param args: details to record with it - an 'item' is named when it's logged as slow
+        """
+        span = Span(name, self._path(name), args)
+        # the stats are added when a span starts, so the summary lists a span before the spans nested in it
+        self._stats(span.path)
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            stack.pop()
+            self._record(span, span.stop())
+
+    def add(self, name: str, seconds: float, **args) -> None:
+        """
+        Record a span that was timed somewhere else, as having just finished inside the current span
+        :param name: name of the span
+        :param seconds: how long it took
+        :param args: details to record with it
+        """
+        span = Span(name, self._path(name), args)
+        span._start_time -= datetime.timedelta(seconds=seconds)
+        self._record(span, seconds)
+
+    def _stats(self, path: str) -> SpanStats:
+        stats = self.stats.get(path)
+        if stats is None:
+            stats = self.stats[path] = SpanStats(path)
+        return stats
+
+    def _record(self, span: Span, seconds: float) -> None:
+        stats = self._stats(span.path)
+        item = span.args.get('item')
+        if (stats.count >= self.min_count and seconds > self.slow_min and seconds > self.slow_factor * stats.mean
+                and config.logger):
+            config.logger.info(f"Slow {span.path}{f' ({item})' if item is not None else ''}: {seconds:.3f}s, "
+                               f"{seconds / stats.mean:.1f}x the average")
+        stats.add(seconds, item)
+        if len(self.events) < self.max_events:
+            self.events.append((span, seconds))
+
+    def summary(self) -> str:
+        """
+        :return: a table of every span path (indented by depth) with its count, total, mean, percentiles and max
+        """
+        lines = [f"{'span':<40} {'count':>7} {'total':>9} {'mean':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  "
+                 f"slowest"]
+        for path, stats in self.stats.items():
+            label = '  ' * path.count('/') + path.rsplit('/', 1)[-1]
+            lines.append(f"{label:<40} {stats.count:>7} {stats.total:>8.3f}s {stats.mean:>7.3f}s "
+                         f"{stats.percentile(50):>7.3f}s {stats.percentile(90):>7.3f}s {stats.percentile(99):>7.3f}s "
+                         f"{stats.slowest:>7.3f}s  {stats.slowest_item if stats.slowest_item is not None else ''}")
+        return '\n'.join(lines)
+
+    def write_chrome_trace(self, trace_file: Path) -> Path:
+        """
+        Save every recorded span as a Chrome trace ("X" complete events, times in microseconds)
+        :param trace_file: where to save the trace
+        :return: Path of the trace
+        """
+        pid = os.getpid()
+        events = [{'name': span.name, 'cat': span.path.split('/')[0], 'ph': 'X', 'pid': pid, 'tid': span.thread,
+                   'ts': round((span.started - self.epoch).total_seconds() * 1e6),
+                   'dur': round(seconds * 1e6), 'args': {key: str(value) for key, value in span.args.items()}}
+                  for span, seconds in self.events]
+        trace_file = Path(trace_file)
+        if not trace_file.parent.exists():
+            trace_file.parent.mkdir(parents=True)
+        with open(trace_file, 'w') as tf:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, tf)
+        return trace_file
+
+    def reset(self) -> None:
+        self.stats = dict()
+        self.events = list()
+        self.epoch = datetime.datetime.now()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self.stats)} span paths, {len(self.events)} spans)"
+
+
+tracer = Tracer()
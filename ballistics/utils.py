@@ -1,54 +1,125 @@
 """
 Utility functions and classes that serve the PlexPlay module
 """
+from __future__ import annotations
+
 import logging
 import os
 import datetime
 import textwrap
-import frontmatter
 
-from typing import List, Union
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Tuple, Union, TYPE_CHECKING
 from pathlib import Path
-from PIL import Image, ImageFont, ImageDraw
-from qrcode import QRCode
+
+from .qrcache import qr_cache
+
+if TYPE_CHECKING:
+    # the imaging, array and markdown libraries are imported by the functions that use them, so that importing the
+    # module (eg for a quick lookup that never draws anything) doesn't pay for them
+    import numpy as np
+    from PIL import Image, ImageFont
+
+# colours of the curves on the profile graph (the rate of rise is plotted against the right hand axis)
+PROFILE_COLOURS = {
+    'beanTemperature': '#1F77B4',
+    'drumTemperature': '#D62728',
+    'exitTemperature': '#FF7F50',
+    'beanDerivative': '#2CA02C',
+}
+
+
+@lru_cache(maxsize=64)
+def load_font(family: str, size: int) -> ImageFont.FreeTypeFont:
+    """
+    Loads a TrueType font, keeping the most recently used ones in memory so they aren't re-read for every label
+    :param family: font name or file
+    :param size: font size
+    :return: the loaded font
+    """
+    from PIL import ImageFont
+    return ImageFont.truetype(family, size)
+
+
+class FontSpec(NamedTuple):
+    """
+    A font that isn't loaded until it's used: the font name (or file) and size to pass to load_font()
+    """
+    family: str
+    size: int
+
+
+class Layout(dict):
+    """
+    A label or graph layout (a config.labels or config.graphs entry). Fonts are given as FontSpecs, and are only loaded
+    when they're looked up - so setting up the config doesn't read any font files.
+    Iterating over the items gives the FontSpecs themselves (which is what label_fingerprint() hashes).
+    """
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        return load_font(*value) if isinstance(value, FontSpec) else value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+@lru_cache(maxsize=8)
+def label_template(width: int, height: int, title_font: ImageFont.FreeTypeFont) -> Dict:
+    """
+    Pre-renders the parts of a label that are the same on every label, once per label layout.
+    Copy the images before drawing on them!
+    :param width: label width in pixels
+    :param height: label height in pixels
+    :param title_font: the font used for the decaf decal
+    :return: dict of the static images: 'canvas', 'decaf' decal, and 'batch' (the batch number underline)
+    """
+    from PIL import Image, ImageDraw
+    canvas = Image.new('RGB', size=(width, height), color='white')
+
+    decafdecal = Image.new("RGB", (115, 50), "white")
+    decafdecalimg = ImageDraw.Draw(decafdecal)
+    decafdecalimg.text((4, 6), "DECAF", font=title_font, fill="#FF7F50")
+    decafdecalimg.line(((0, 2), (120, 2)), "#FF7F50", 3)
+    decafdecalimg.line(((0, 48), (120, 48)), "#FF7F50", 3)
+
+    bimg = Image.new("L", (100, 100), 255)
+    ImageDraw.Draw(bimg).line(((0, 52), (85, 52)), 0, 4)
+    return {'canvas': canvas, 'decaf': decafdecal, 'batch': bimg}
 
 
 def generate_large_label(label_conf: dict, batch: str, name: str, url: str, is_decaf: bool,
                          roast_date: datetime.datetime, start_date: datetime.datetime, end_date: datetime.datetime,
                          country: str, logger: logging.Logger) -> Image:
+    from PIL import ImageDraw
     # label = config.labels['large']
     large_label_width = label_conf['width']
     large_label_height = label_conf['height']
     label_size = (large_label_width, large_label_height)  # 2" x 3"
-    img = Image.new('RGB', size=(large_label_width, large_label_height), color='white')
+    template = label_template(large_label_width, large_label_height, label_conf['font_title'])
+    img = template['canvas'].copy()
 
     # GENERATE QR CODE
     # regular URLs are 43 digits long and the QR code is the right size, blend URLs are 68 and the QR code is too big
     box_size = 10
     if len(url) > 60:
         box_size = 9
-    qr = QRCode(box_size=box_size, border=1, version=1)
-    qr.add_data(url)
-    qrimg = qr.make_image()
+    qrimg = qr_cache.get(url, box_size=box_size, border=1, version=1)
     img.paste(qrimg, (25, 130))
 
     # IF IT'S DECAF, add a decal to the QR code
     if is_decaf:
-        decafdecal = Image.new("RGB", (115, 50), "white")
-        decafdecalimg = ImageDraw.Draw(decafdecal)
-        decafdecalimg.text((4, 6), "DECAF", font=label_conf['font_title'], fill="#FF7F50")
-        decafdecalimg.line(((0, 2), (120, 2)), "#FF7F50", 3)
-        decafdecalimg.line(((0, 48), (120, 48)), "#FF7F50", 3)
-        img.paste(decafdecal, (140, 260))
+        img.paste(template['decaf'], (140, 260))
 
     # ADD TEXT to the label
     canvas = ImageDraw.Draw(img)
     # BATCH NUMBER, rotated 90 degrees
-    bimg = Image.new("L", (100, 100), 255)
+    # (the underline is already on the template, and both are black, so drawing order doesn't matter)
+    bimg = template['batch'].copy()
     bnumimg = ImageDraw.Draw(bimg)
     batch_font = scale_font(label_conf['font_batch'], batch, 2, 3, 1, logger)
     bnumimg.text((0, 0), batch, font=batch_font, fill=0)
-    bnumimg.line(((0, 52), (85, 52)), 0, 4)
     bimg = bimg.rotate(90, expand=False, fillcolor=0)
     img.paste(bimg, (8, 10))
     # ROAST NAME
@@ -75,6 +146,76 @@ def generate_large_label(label_conf: dict, batch: str, name: str, url: str, is_d
     return img
 
 
+def generate_profile_graph(graph_conf: dict, curves: Dict[str, np.ndarray], sample_rate: float,
+                           markers: Dict[str, int], logger: logging.Logger) -> Image:
+    """
+    Draw a roast profile graph: bean, drum and exit temperatures (left axis) and the rate of rise (right axis),
+    with vertical markers at the roast events.
+    Each curve is min/max downsampled to the pixel width of the plot before it's drawn.
+    :param graph_conf: the graph layout, a config.graphs entry
+    :param curves: dict of curve name -> sample array
+    :param sample_rate: samples per second
+    :param markers: dict of marker label -> sample index (eg 'First crack': indexFirstCrackStart)
+    :param logger: logger
+    :return: the graph image
+    """
+    import numpy as np
+    from PIL import Image, ImageDraw
+    from .curves import minmax_downsample
+    width, height, margin = graph_conf['width'], graph_conf['height'], graph_conf['margin']
+    font = graph_conf['font']
+    plot_w, plot_h = width - 2 * margin, height - 2 * margin
+    img = Image.new('RGB', size=(width, height), color='white')
+    canvas = ImageDraw.Draw(img)
+    canvas.rectangle((margin, margin, width - margin, height - margin), outline='#888888')
+
+    samples = max(len(curve) for curve in curves.values())
+    if samples < 2:
+        logger.info(f"Not enough samples ({samples}) to draw a profile graph")
+        return img
+    temps = [curves[name] for name in ('beanTemperature', 'drumTemperature', 'exitTemperature') if len(curves[name])]
+    temp_top = float(np.ceil(max(max(float(t.max()) for t in temps), 1.0) / 50.0) * 50.0) if temps else 50.0
+    ror = curves['beanDerivative']
+    ror_top = float(np.ceil(max(float(ror.max()), 1.0) / 5.0) * 5.0) if len(ror) else 1.0
+
+    def to_x(index):
+        return margin + index * (plot_w / (samples - 1))
+
+    def to_y(value, top):
+        return margin + plot_h - np.clip(value, 0.0, top) * (plot_h / top)
+
+    # AXES: temperature every 50 degrees on the left, rate of rise on the right, time every minute along the bottom
+    for temp in range(0, int(temp_top) + 1, 50):
+        y = float(to_y(temp, temp_top))
+        canvas.line(((margin, y), (width - margin, y)), '#EEEEEE', 1)
+        canvas.text((4, y - 7), f"{temp}°", font=font, fill='#444444')
+    for rate in np.linspace(0.0, ror_top, 6):
+        canvas.text((width - margin + 4, float(to_y(rate, ror_top)) - 7), f"{rate:.0f}", font=font,
+                    fill=PROFILE_COLOURS['beanDerivative'])
+    for minute in range(0, int(samples / sample_rate / 60) + 1):
+        x = float(to_x(minute * 60 * sample_rate))
+        canvas.text((x - 4, height - margin + 4), f"{minute}", font=font, fill='#444444')
+
+    # CURVES
+    for name, colour in PROFILE_COLOURS.items():
+        curve = curves.get(name)
+        if curve is None or len(curve) < 2:
+            continue
+        indices, values = minmax_downsample(curve, plot_w)
+        top = ror_top if name == 'beanDerivative' else temp_top
+        points = np.column_stack((to_x(indices), to_y(values, top)))
+        canvas.line(points.ravel().tolist(), fill=colour, width=2)
+
+    # MARKERS
+    for label, index in markers.items():
+        if index is None or not 0 <= index < samples:
+            continue
+        x = float(to_x(index))
+        canvas.line(((x, margin), (x, height - margin)), '#444444', 1)
+        canvas.text((x + 3, margin + 2), label, font=font, fill='#444444')
+    return img
+
+
 def scale_font(source_font: ImageFont, source_text: str, min_len: int, max_len: int, num_lines: int,
                logger: logging.Logger) -> ImageFont:
     adjusted_font = source_font
@@ -92,17 +233,27 @@ def scale_font(source_font: ImageFont, source_text: str, min_len: int, max_len:
     # if the source text is longer than max_len, scale it down
     if len(source_text) > max_len:
         size = int(round(source_font.size * max_len / len(source_text)))
-        adjusted_font = ImageFont.truetype(source_font.font.family, size)
+        adjusted_font = load_font(source_font.font.family, size)
         logger.info(f"scaling origin str down to size {adjusted_font.size}")
     # if the source text is shorter than min_len, scale it up
     if len(source_text) < min_len:
         size = int(round(source_font.size * min_len / len(source_text)))
-        adjusted_font = ImageFont.truetype(source_font.font.family, size)
+        adjusted_font = load_font(source_font.font.family, size)
         logger.info(f"scaling origin str up to size {adjusted_font.size}")
     return adjusted_font
 
 
-def merge_markdown(original: Path, annotation: Path) -> str:
+def read_markdown(file: Path) -> Tuple[Dict, str]:
+    """
+    :param file: Path to a markdown file with frontmatter
+    :return: (frontmatter dict, content)
+    """
+    import frontmatter
+    post = frontmatter.load(file)
+    return post.metadata, post.content
+
+
+def merge_markdown(original: Path, annotation: Path, loader=read_markdown) -> str:
     """
     Take two markdown files and annotate the original.
     Annotation goes like this:
@@ -114,29 +265,77 @@ def merge_markdown(original: Path, annotation: Path) -> str:
     :param original: Path to the "original" markdown file
     :param annotation Path to the "annotation" markdown file - this needs to be a Path but the file is ignored if it
         doesn't exist
+    :param loader: (optional) function that returns the (frontmatter, content) of the annotation, eg from a cache
     :return: merged string
     """
-    orig_file = frontmatter.load(original)
-    meta = orig_file.metadata
-    content = orig_file.content.split('\n')
+    meta, content = read_markdown(original)
+    content = content.split('\n')
     if annotation.exists():
-        annotation_file = frontmatter.load(annotation)
+        annotation_meta, annotation_content = loader(annotation)
         # merge frontmatter:
-        meta.update(annotation_file.metadata)
+        meta.update(annotation_meta)
 
         # merge content (assuming top row is header, keep it, then insert on row 2 all the override content,
         # surrounded by blank lines - then the rest of the original content
         content[1:1] = '\n'
-        content[1:1] = annotation_file.content.split('\n')
+        content[1:1] = annotation_content.split('\n')
         content[1:1] = '\n'
 
     # combine into one big happy markdown file
-    results = '---\n'
-    for item in meta.items():
-        results += f"{item[0]}: {item[1]}\n"
-    results += '---\n'
-    results += '\n'.join(content)
-    return results
+    return ''.join(['---\n', *(f"{key}: {value}\n" for key, value in meta.items()), '---\n', '\n'.join(content)])
+
+
+@dataclass
+class WriteStats:
+    """
+    Running count of the files write_if_changed() has written, and left alone because they were already up to date
+    """
+    written: int = 0
+    unchanged: int = 0
+
+    def __repr__(self):
+        return f"{self.written} written, {self.unchanged} unchanged"
+
+
+write_stats = WriteStats()
+
+
+def write_if_changed(output_file: Path, text: str, stats: WriteStats = None) -> bool:
+    """
+    Save a (fully built) document, but only if it differs from what's already in the file - so unchanged outputs
+    keep their modification times, and don't look new to whatever syncs or publishes them.
+    The file is written to a temporary file first and then renamed over the original, so it's never left half written.
+    :param output_file: Path of the file
+    :param text: the whole content of the file
+    :param stats: (optional) the WriteStats to count the write in, defaults to write_stats
+    :return: True if the file was written, False if it was already up to date
+    """
+    if stats is None:
+        stats = write_stats
+    data = text.encode('utf-8')
+    if output_file.exists() and output_file.stat().st_size == len(data) and output_file.read_bytes() == data:
+        stats.unchanged += 1
+        return False
+    if not output_file.parent.exists():
+        output_file.parent.mkdir(parents=True)
+    tmp_file = output_file.with_name(f".{output_file.name}.tmp")
+    with open(tmp_file, 'wb') as tmpf:
+        tmpf.write(data)
+    os.replace(tmp_file, output_file)
+    stats.written += 1
+    return True
+
+
+def save_image(img: Image.Image, output_file: Path) -> None:
+    """
+    Save an image to a temporary file and rename it over the original, so the file is replaced rather than rewritten
+    in place (which would also change any published hardlinks to it) and is never seen half written
+    :param img: the image
+    :param output_file: Path of the image file (its suffix picks the format)
+    """
+    tmp_file = output_file.with_name(f".{output_file.stem}.tmp{output_file.suffix}")
+    img.save(tmp_file)
+    os.replace(tmp_file, output_file)
 
 
 def get_from_env(name: str) -> Union[int, str, List, None]:
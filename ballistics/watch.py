@@ -0,0 +1,185 @@
+"""
+Watch.
+Watches directories for files being created, changed, moved or deleted, and hands them back in batches once they've
+settled: a file only counts as changed once nothing has touched it for a few seconds, so a roast that RoasTime is
+still writing isn't picked up half written.
+Uses inotify on Linux (through ctypes, so there's nothing extra to install), and falls back to polling the directories
+elsewhere, or if inotify isn't available.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# inotify event flags (from <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# wd, mask, cookie, length of the name that follows
+EVENT = struct.Struct('iIII')
+
+
+def is_ignored(file: Path) -> bool:
+    """
+    :return: True for files that are never worth reacting to: hidden and temporary files (eg an editor's swap files,
+        or the temporary files our own atomic writes rename into place)
+    """
+    return file.name.startswith('.') or file.name.endswith('~')
+
+
+class Inotify(object):
+    """
+    Minimal inotify binding: watches a set of directories (not recursively) for changes to the files in them.
+    Inotify.read() waits for events and returns the Paths they were about
+    """
+
+    def __init__(self, dirs: Iterable[Path]):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.dirs = dict()
+        for directory in dirs:
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"{os.strerror(ctypes.get_errno())}: {directory}")
+            self.dirs[wd] = Path(directory)
+
+    def read(self, timeout: float) -> List[Path]:
+        """
+        :param timeout: seconds to wait for an event
+        :return: the Paths that changed (every file in the watched directories if the kernel's queue overflowed)
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return list()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return list()
+        paths = list()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped, so everything has to be looked at again
+                return [file for directory in self.dirs.values() for file in directory.iterdir() if file.is_file()]
+            if wd in self.dirs and name:
+                paths.append(self.dirs[wd] / os.fsdecode(name))
+        return paths
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class Poller(object):
+    """
+    Polling stand in for Inotify: compares the (mtime, size) of every file in the directories with the last look.
+    Poller.read() waits for the timeout, then returns the Paths that were created, changed or deleted since
+    """
+
+    def __init__(self, dirs: Iterable[Path]):
+        self.dirs = [Path(directory) for directory in dirs]
+        self._files = self._scan()
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        files = dict()
+        for directory in self.dirs:
+            if not directory.exists():
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        files[Path(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def read(self, timeout: float) -> List[Path]:
+        time.sleep(timeout)
+        files = self._scan()
+        changed = [file for file, key in files.items() if self._files.get(file) != key]
+        changed.extend(file for file in self._files if file not in files)
+        self._files = files
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class Watcher(object):
+    """
+    Watches directories, and debounces the changes: a changed file is held back until it has been left alone for
+    settle seconds, then handed back with whatever else has settled by then.
+    Watcher.changes() yields each batch of settled Paths, forever
+    Watcher.poll() waits (at most poll seconds) and returns whatever has settled, which may be nothing
+    Watcher.close() stops watching
+    """
+
+    def __init__(self, dirs: Iterable[Path], settle: float = 2.0, poll: float = 1.0, use_inotify: bool = True):
+        """
+        :param dirs: the directories to watch (not recursively), directories that don't exist are skipped
+        :param settle: seconds a file has to be left alone before it counts as changed
+        :param poll: seconds between looks at the directories (when polling), and the longest poll() waits
+        :param use_inotify: (optional) set False to poll even where inotify is available
+        """
+        self.dirs = [Path(directory) for directory in dirs if Path(directory).is_dir()]
+        self.settle = settle
+        self.poll_interval = poll
+        self._pending = dict()
+        self.backend = None
+        if use_inotify and sys.platform.startswith('linux'):
+            try:
+                self.backend = Inotify(self.dirs)
+            except (OSError, AttributeError):
+                # eg out of inotify watches, or a libc without inotify
+                self.backend = None
+        if self.backend is None:
+            self.backend = Poller(self.dirs)
+
+    def poll(self) -> List[Path]:
+        """
+        Wait for changes, then return the files that have settled
+        :return: sorted list of the Paths that changed (and have been left alone for long enough)
+        """
+        timeout = self.poll_interval
+        if self._pending:
+            timeout = min(timeout, max(0.0, min(self._pending.values()) + self.settle - time.monotonic()))
+        touched = [file for file in self.backend.read(timeout) if not is_ignored(file)]
+        now = time.monotonic()
+        for file in touched:
+            self._pending[file] = now
+        settled = sorted(file for file, touched_at in self._pending.items() if now - touched_at >= self.settle)
+        for file in settled:
+            del self._pending[file]
+        return settled
+
+    def changes(self) -> Iterator[List[Path]]:
+        """
+        :return: iterator of batches of changed Paths, each batch is handed back as soon as it has settled
+        """
+        while True:
+            files = self.poll()
+            if files:
+                yield files
+
+    def close(self) -> None:
+        self.backend.close()
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}({len(self.dirs)} directories, {self.backend.__class__.__name__}, "
+                f"{self.settle}s settle)")
@@ -0,0 +1,54 @@
+"""
+Benchmark: the header-only JSON reader against a full json.load of RoasTime roast files.
+
+By default it times synthetic roast files of a few realistic sizes (a 12 minute roast at 2 samples/second has ~1500
+samples in each of its five curves). Pass --roasts to time every file in config.roasts_dir instead.
+
+Run from the repo root: python -m benchmarks.bench_json_header
+"""
+import argparse
+import json
+import random
+import timeit
+from pathlib import Path
+
+from ballistics.jsonheader import parse_json_header
+
+
+def synthetic_roast(samples: int) -> str:
+    """
+    :param samples: number of samples in each curve
+    :return: JSON text shaped like a RoasTime roast file
+    """
+    curves = {name: [round(random.uniform(20.0, 240.0), 1) for _ in range(samples)]
+              for name in ('beanTemperature', 'drumTemperature', 'exitTemperature', 'beanDerivative', 'ibtsDerivative')}
+    return json.dumps(dict(uid='00000000-0000-0000-0000-000000000000', roastName='322 - Benchmark Roast',
+                           beanId='00000000-0000-0000-0000-000000000001', isFork=0, weightGreen=500,
+                           weightRoasted=430, dateTime=1600000000000, totalRoastTime=720, sampleRate=2,
+                           roastStartIndex=20, indexYellowingStart=500, indexFirstCrackStart=1200, roastDegree=3,
+                           actions={'actionTimeList': [{'ctrlType': 0, 'index': i, 'value': 5} for i in range(40)]},
+                           **curves))
+
+
+def bench(label: str, texts: list, number: int) -> None:
+    full = min(timeit.repeat(lambda: [json.loads(t) for t in texts], number=number, repeat=3)) / number
+    header = min(timeit.repeat(lambda: [parse_json_header(t) for t in texts], number=number, repeat=3)) / number
+    size = sum(len(t) for t in texts) / len(texts) / 1024
+    print(f"{label:>24}: {len(texts):4d} files, {size:7.1f}KB avg | json.load {full * 1000:8.2f}ms | "
+          f"header {header * 1000:8.2f}ms | {full / header:5.1f}x faster")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--roasts', action='store_true', help='benchmark the real files in config.roasts_dir')
+    parser.add_argument('--number', type=int, default=5, help='timing loops per measurement')
+    args = parser.parse_args()
+
+    if args.roasts:
+        from ballistics import config
+        config.init_env()
+        bench('config.roasts_dir', [f.read_text() for f in config.roasts_dir.glob('*')], args.number)
+    else:
+        random.seed(322)
+        for samples in (600, 1500, 3000):
+            bench(f"{samples} samples/curve", [synthetic_roast(samples) for _ in range(20)], args.number)
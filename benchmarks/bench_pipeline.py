@@ -0,0 +1,170 @@
+"""
+Benchmark: the stages of process_roastime.py, end to end, on synthetic RoasTime datasets of increasing size.
+
+For each size (100, 1000 and 10000 roasts by default) a dataset is generated with benchmarks.synthetic in a scratch
+directory, then the stages of process_roastime.py are run against it in a fresh process (so nothing is cached in
+memory, and the peak memory is that size's alone). Each stage is timed, and the peak RSS reached by the end of it is
+recorded, for the main process and for the worker processes (labels are rendered in a process pool).
+The results are written to a JSON file; pass --compare with an earlier results file to see what changed.
+
+Run from the repo root: python -m benchmarks.bench_pipeline --sizes 100 1000
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.synthetic import DatasetSpec, generate_dataset
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """
+    :param who: resource.RUSAGE_SELF, or RUSAGE_CHILDREN for the largest child process
+    :return: peak resident set size so far, in MB
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_stages(result_file: Path) -> None:
+    """
+    Run the process_roastime.py stages, in the same order as a normal run, against the configured directories.
+    This runs in the child process, configured through the BALL_* environment variables.
+    :param result_file: where to write the stage timings (JSON)
+    """
+    import process_roastime as pipeline
+    from ballistics import catalog, config, BeanCollection, RoastCollection
+    from ballistics.manifest import BuildManifest
+    from ballistics.reports import bean_usage_report
+    from ballistics.utils import Stopwatch
+
+    config.init_env()
+    # process_roastime.py sets its logger up when it's run as a script
+    pipeline.log = config.logger
+    stages = dict()
+
+    def stage(name: str, func):
+        timer = Stopwatch()
+        result = func()
+        stages[name] = {'seconds': round(timer.stop(), 4), 'peak_rss_mb': round(peak_rss_mb(), 1),
+                        'peak_worker_rss_mb': round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1)}
+        return result
+
+    rc = stage('load_roasts', RoastCollection)
+    bc = stage('load_beans', BeanCollection)
+    manifest = BuildManifest(config.manifestFile)
+    stage('ingest_beans', lambda: pipeline.ingest_beans(bc))
+    stage('publish_beans', lambda: pipeline.publish_beans(manifest))
+    stage('ingest_roasts', lambda: pipeline.ingest_roasts(rc))
+    stage('publish_roasts', lambda: pipeline.publish_roasts(manifest))
+    stage('publish_blends', lambda: pipeline.publish_blends(manifest))
+    stage('usage_report', bean_usage_report)
+    manifest.save()
+    catalog.save()
+    # and a second load of the catalog, from the header cache
+    stage('warm_load', lambda: catalog.load(force=True))
+    with open(result_file, 'w') as rf:
+        json.dump(stages, rf)
+
+
+def run_size(size: int, workdir: Path, spec_args: dict) -> dict:
+    """
+    Generate a dataset of one size and run the pipeline on it, in a child process
+    :param size: number of roasts
+    :param workdir: scratch directory
+    :param spec_args: the rest of the DatasetSpec
+    :return: dict of the dataset counts and the stage results
+    """
+    root = workdir / f"roasts-{size}"
+    started = datetime.datetime.now()
+    counts = generate_dataset(root / 'roastime', DatasetSpec(roasts=size, **spec_args))
+    generate_seconds = (datetime.datetime.now() - started).total_seconds()
+    output = root / 'output'
+    # the caches are set explicitly too, so a .env file can't point them somewhere else
+    env = dict(os.environ, BALL_USER='', BULLET_USER='', BALL_HOME_DIR=str(root / 'roastime'),
+               BALL_ANNOTATIONS_DIR=str(root / 'roastime/annotations'), BALL_OUTPUT_DIR=str(output),
+               BALL_PUBLISH_DIR=str(root / 'publish'), BALL_LOG_FILE=str(root / 'bench.log'), BALL_LOG_LEVEL='INFO',
+               BALL_CACHE_FILE=str(output / '.ballistics-cache.sqlite'), BALL_QR_CACHE_DIR=str(output / '.qr-cache'),
+               BALL_MANIFEST_FILE=str(output / '.ballistics-manifest.json'), BALL_NO_CACHE='')
+    result_file = root / 'stages.json'
+    subprocess.run([sys.executable, '-m', 'benchmarks.bench_pipeline', '--child', str(result_file)], env=env,
+                   check=True, cwd=Path(__file__).parent.parent)
+    with open(result_file) as rf:
+        stages = json.load(rf)
+    return {'roasts': size, 'dataset': counts, 'generate_seconds': round(generate_seconds, 2), 'stages': stages,
+            'total_seconds': round(sum(stage['seconds'] for stage in stages.values()), 4)}
+
+
+def print_run(run: dict, previous: dict = None) -> None:
+    print(f"\n{run['roasts']} roasts ({run['dataset']['bytes'] / 1e6:.0f}MB of JSON, generated in "
+          f"{run['generate_seconds']:.1f}s)")
+    for name, stage in list(run['stages'].items()) + [('total', {'seconds': run['total_seconds']})]:
+        line = f"{name:>16}: {stage['seconds']:9.3f}s"
+        if 'peak_rss_mb' in stage:
+            line += f" | peak RSS {stage['peak_rss_mb']:8.1f}MB (workers {stage['peak_worker_rss_mb']:7.1f}MB)"
+        if previous:
+            before = previous['total_seconds'] if name == 'total' else previous['stages'].get(name, {}).get('seconds')
+            if before:
+                line += f" | was {before:9.3f}s ({stage['seconds'] / before:5.2f}x)"
+        print(line)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        return ''
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000], help='numbers of roasts to run')
+    parser.add_argument('--samples', type=int, default=None, help='samples per curve (defaults to realistic lengths)')
+    parser.add_argument('--name-style', default='mixed',
+                        help='shape of the bean/roast names (see benchmarks.synthetic)')
+    parser.add_argument('--seed', type=int, default=322)
+    parser.add_argument('--workdir', type=Path, default=None,
+                        help='where to generate the datasets and outputs (defaults to a temporary directory)')
+    parser.add_argument('--output', type=Path, default=None,
+                        help='results file (defaults to benchmarks/results/pipeline-<timestamp>.json)')
+    parser.add_argument('--compare', type=Path, default=None, help='an earlier results file to compare against')
+    parser.add_argument('--child', type=Path, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_stages(args.child)
+        sys.exit()
+
+    previous = dict()
+    if args.compare:
+        with open(args.compare) as cf:
+            previous = {run['roasts']: run for run in json.load(cf)['runs']}
+    results = {
+        'meta': {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                 'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                 'samples': args.samples, 'name_style': args.name_style, 'seed': args.seed},
+        'runs': list(),
+    }
+    spec_args = dict(samples=args.samples, name_style=args.name_style, seed=args.seed)
+    with tempfile.TemporaryDirectory(prefix='ballistics-bench-') as tmpdir:
+        workdir = args.workdir or Path(tmpdir)
+        for size in args.sizes:
+            run = run_size(size, workdir, spec_args)
+            results['runs'].append(run)
+            print_run(run, previous.get(size))
+
+    output = args.output or RESULTS_DIR / f"pipeline-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as of:
+        json.dump(results, of, indent=1)
+    print(f"\nResults written to {output}")
@@ -0,0 +1,57 @@
+"""
+Benchmark: start up time - importing ballistics, and answering a lookup, in a fresh interpreter.
+
+Each run is a new process (so nothing is already imported), timed with `python -X importtime`. Prints the total
+import time, the slowest modules, and which of the heavy libraries (imaging, arrays, markdown) got imported, which
+should be none of them until something is drawn or merged.
+
+Run from the repo root: python -m benchmarks.bench_startup
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+HEAVY_MODULES = ('PIL', 'qrcode', 'numpy', 'frontmatter', 'yaml', 'slugify')
+SNIPPETS = {
+    'import': 'import ballistics',
+    'lookup': 'import ballistics; ballistics.config.init_env(); ballistics.find_roast_by("1", method="batch")',
+}
+
+
+def import_times(snippet: str) -> dict:
+    """
+    :param snippet: python code to run in a fresh interpreter
+    :return: dict of top level module name -> cumulative import time in microseconds, plus the modules that were
+        loaded (under 'loaded')
+    """
+    check = f"{snippet}; import sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', check], capture_output=True, text=True,
+                            check=True, cwd=Path(__file__).parent.parent)
+    times = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # nested imports are indented further, only the top level ones add up to the total
+        if len(name) - len(name.lstrip()) == 1:
+            times[name.strip()] = int(cumulative)
+    times['loaded'] = [name for name in result.stdout.strip().split(',') if name]
+    return times
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5, help='number of fresh interpreters to time each snippet in')
+    parser.add_argument('--top', type=int, default=8, help='number of the slowest modules to list')
+    args = parser.parse_args()
+
+    for label, snippet in SNIPPETS.items():
+        runs = [import_times(snippet) for _ in range(args.runs)]
+        totals = [sum(value for name, value in run.items() if name != 'loaded') / 1000 for run in runs]
+        print(f"\n{label}: {statistics.median(totals):.1f}ms median import time over {args.runs} runs "
+              f"(min {min(totals):.1f}ms) | heavy modules loaded: {', '.join(runs[-1]['loaded']) or 'none'}")
+        slowest = sorted(((value, name) for name, value in runs[-1].items() if name != 'loaded'), reverse=True)
+        for value, name in slowest[:args.top]:
+            print(f"{name:>32}: {value / 1000:7.1f}ms")
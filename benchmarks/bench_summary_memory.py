@@ -0,0 +1,55 @@
+"""
+Benchmark: memory per object of the full Roast/Bean objects against the RoastSummary/BeanSummary records.
+
+The catalog is loaded first, so the headers it holds (which both kinds share) aren't counted - only the memory that
+building each collection adds, divided by the number of objects in it. Uses the files in config.roasts_dir and
+config.beans_dir.
+
+Run from the repo root: python -m benchmarks.bench_summary_memory
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+
+from ballistics import catalog, config, BeanCollection, RoastCollection
+
+
+def measure(label: str, build) -> list:
+    """
+    :param label: what's being measured
+    :param build: function that builds and returns the objects
+    :return: the objects (so they're still alive when the next measurement is taken)
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    count = max(len(objects), 1)
+    # the shallow size of a dataclass doesn't include its __dict__, so that's added on
+    shallow = sum(sys.getsizeof(obj) + (sys.getsizeof(obj.__dict__) if hasattr(obj, '__dict__') else 0)
+                  for obj in objects) / count
+    print(f"{label:>14}: {len(objects):5d} objects | {(after - before) / count:8.0f} bytes each (traced) | "
+          f"{shallow:6.0f} bytes each (shallow)")
+    return objects
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.parse_args()
+
+    config.init_env()
+    catalog.load()
+    # build (and drop) a few of each first, so what they do once on first use - the lazy imports (slugify), the bean
+    # usage - isn't counted against the first kind measured
+    for lightweight in (False, True):
+        BeanCollection(lightweight=lightweight, bean_ids=list(catalog.beans)[:1])
+        RoastCollection(lightweight=lightweight, roast_ids=list(catalog.roasts)[:10])
+    keep = [
+        measure('Bean', lambda: BeanCollection().beans),
+        measure('BeanSummary', lambda: BeanCollection(lightweight=True).beans),
+        measure('Roast', lambda: RoastCollection().roasts),
+        measure('RoastSummary', lambda: RoastCollection(lightweight=True).roasts),
+    ]
@@ -0,0 +1,193 @@
+"""
+Synthetic RoasTime dataset generator.
+
+Writes realistic fake roasts/ and beans/ directories (shaped like the RoasTime files: header fields, five sample
+curves and a list of actions), plus an annotations directory of roast, bean and blend markdown, for benchmarking.
+A share of the roasts are forks (recipes/borrowed profiles) or aberrantly named, as in a real RoasTime directory.
+
+Run from the repo root: python -m benchmarks.synthetic /tmp/roastime --roasts 1000
+The output directory gets roasts/, beans/ and annotations/{roasts,beans,blends}/ - point BALL_HOME_DIR at it, and
+BALL_ANNOTATIONS_DIR at its annotations directory.
+"""
+import argparse
+import datetime
+import json
+import random
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+COUNTRIES = ['Ethiopia', 'Kenya', 'Colombia', 'Guatemala', 'Brazil', 'Costa Rica', 'Rwanda', 'Sumatra', 'Peru', '']
+REGIONS = ['Yirgacheffe', 'Guji', 'Nyeri', 'Huila', 'Antigua', 'Cerrado', 'Tarrazú', 'Nyamasheke', 'Aceh', 'Cajamarca']
+PROCESSES = ['Washed', 'Natural', 'Honey', 'Wet Hulled', 'Anaerobic Natural']
+FARMS = ['Finca El Paraíso', 'Kiamabara', 'Hambela Estate', 'La Esperanza', 'Fazenda Santa Inês', 'Gatomboya']
+NOTES = ['Blueberry', 'Jasmine', 'Chocolate', 'Stone Fruit', 'Bergamot', 'Caramel', 'Black Tea', 'Citrus']
+# name shapes: short ("Kenya Nyeri"), long (origin, farm, process and notes) and unicode (accented farm names)
+NAME_STYLES = ('short', 'long', 'unicode', 'mixed')
+
+
+@dataclass
+class DatasetSpec:
+    """
+    What to generate
+    """
+    roasts: int = 100
+    beans: int = None
+    samples: int = None
+    fork_rate: float = 0.03
+    aberrant_rate: float = 0.02
+    annotation_rate: float = 0.2
+    blends: int = 5
+    name_style: str = 'mixed'
+    seed: int = 322
+
+    def __post_init__(self):
+        # about eight roasts per bean, like a home roaster working through a few kg of each
+        self.beans = self.beans or max(3, self.roasts // 8)
+
+
+def _uid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128)))
+
+
+def bean_name(rng: random.Random, style: str) -> str:
+    if style == 'mixed':
+        style = rng.choice(NAME_STYLES[:3])
+    country = rng.choice(COUNTRIES[:-1])
+    if style == 'short':
+        return f"{country} {rng.choice(REGIONS)}"
+    if style == 'unicode':
+        return f"{country} {rng.choice(FARMS)} {rng.choice(PROCESSES)}"
+    # (no " - " in a name, as that splits the batch number from the name of a roast, and no ": " or "/" either, as
+    # the name ends up in the markdown frontmatter and file name)
+    notes = ', '.join(rng.sample(NOTES, 3))
+    return f"{country} {rng.choice(REGIONS)} {rng.choice(FARMS)} {rng.choice(PROCESSES)}, {notes}"
+
+
+def roast_curves(rng: np.random.Generator, samples: int, start: int, first_crack: int) -> dict:
+    """
+    :return: dict of curve name -> list of samples, shaped like a real roast (charge, turning point, then a slowing
+        rise through first crack)
+    """
+    t = np.arange(samples, dtype=np.float64)
+    since = np.clip(t - start, 0, None)
+    charge = rng.uniform(190, 230)
+    # held at the charge temperature until the start, then the bean probe drops to the turning point and rises
+    # along a flattening curve
+    rise = 85 + (charge - 85) * np.exp(-since / 40) + 140 * (1 - np.exp(-since / (first_crack * 0.5)))
+    bean = np.where(t < start, charge, rise)
+    bean += rng.normal(0, 0.3, samples)
+    drum = 240 + 15 * np.sin(t / 200) + rng.normal(0, 0.5, samples)
+    exit_temp = 0.55 * bean + 0.35 * drum + rng.normal(0, 0.5, samples)
+    bean_ror = np.gradient(bean) * 120
+    ibts = bean + rng.normal(0, 1.0, samples)
+    ibts_ror = np.gradient(ibts) * 120
+    return {name: np.round(curve, 1).tolist() for name, curve in (
+        ('beanTemperature', bean), ('drumTemperature', drum), ('exitTemperature', exit_temp),
+        ('beanDerivative', bean_ror), ('ibtsDerivative', ibts_ror))}
+
+
+def generate_dataset(root: Path, spec: DatasetSpec) -> dict:
+    """
+    Write a synthetic RoasTime directory (and annotations) under root
+    :param root: directory to write into (created if needed)
+    :param spec: what to generate
+    :return: dict of counts (roasts, forks, aberrant, beans, annotations, blends) and bytes written
+    """
+    rng = random.Random(spec.seed)
+    nprng = np.random.default_rng(spec.seed)
+    dirs = {name: root / name for name in ('roasts', 'beans', 'annotations/roasts', 'annotations/beans',
+                                          'annotations/blends')}
+    for directory in dirs.values():
+        directory.mkdir(parents=True, exist_ok=True)
+    counts = dict(roasts=0, forks=0, aberrant=0, beans=0, annotations=0, blends=0, bytes=0)
+
+    beans = list()
+    for i in range(spec.beans):
+        uid = _uid(rng)
+        name = bean_name(rng, spec.name_style) + (' Decaf' if rng.random() < 0.1 else '')
+        header = dict(uid=uid, name=name, description=f"{', '.join(rng.sample(NOTES, 3))}. " * rng.randint(1, 6),
+                      country=rng.choice(COUNTRIES), region=rng.choice(REGIONS), farm=rng.choice(FARMS),
+                      process=rng.choice(PROCESSES), isOrganic=rng.random() < 0.3, espresso=rng.random() < 0.2)
+        text = json.dumps(header)
+        (dirs['beans'] / uid).write_text(text)
+        counts['bytes'] += len(text)
+        beans.append(header)
+        if rng.random() < spec.annotation_rate:
+            (dirs['annotations/beans'] / f"{name.strip()}.md").write_text(
+                f"---\nscore: {rng.randint(80, 92)}\n---\n{rng.choice(NOTES)} all the way.\n")
+            counts['annotations'] += 1
+    counts['beans'] = len(beans)
+
+    when = datetime.datetime(2020, 1, 1)
+    batch = 0
+    for i in range(spec.roasts):
+        uid = _uid(rng)
+        bean = rng.choice(beans)
+        rate = 2
+        minutes = rng.uniform(9, 14)
+        samples = spec.samples or int(minutes * 60 * rate) + 60
+        start = 30
+        first_crack = int(samples * rng.uniform(0.75, 0.85))
+        yellowing = int(start + (first_crack - start) * rng.uniform(0.4, 0.5))
+        is_fork = rng.random() < spec.fork_rate
+        if is_fork:
+            name = f"{bean['name']} profile"
+            counts['forks'] += 1
+        elif rng.random() < spec.aberrant_rate:
+            name = f"Test roast {bean['name']}"
+            counts['aberrant'] += 1
+        else:
+            batch += 1
+            name = f"{batch:03d} - {bean['name']}"
+        when += datetime.timedelta(hours=rng.uniform(4, 60))
+        weight_green = rng.choice([250, 350, 450, 500, 750, 1000])
+        header = dict(uid=uid, roastName=name, beanId=bean['uid'], isFork=1 if is_fork else 0,
+                      weightGreen=weight_green, weightRoasted=round(weight_green * rng.uniform(0.82, 0.88), 1),
+                      dateTime=int(when.timestamp() * 1000), totalRoastTime=round((samples - start) / rate, 1),
+                      sampleRate=rate, roastStartIndex=start, indexYellowingStart=yellowing,
+                      indexFirstCrackStart=first_crack, roastDegree=rng.randint(0, 6))
+        header.update(roast_curves(nprng, samples, start, first_crack))
+        header['actions'] = {'actionTimeList': [{'ctrlType': rng.randint(0, 2), 'index': rng.randrange(samples),
+                                                 'value': rng.randint(1, 9)} for _ in range(rng.randint(10, 60))]}
+        text = json.dumps(header)
+        (dirs['roasts'] / uid).write_text(text)
+        counts['bytes'] += len(text)
+        counts['roasts'] += 1
+        if name[:3].isdigit() and rng.random() < spec.annotation_rate:
+            notes = ', '.join(rng.sample(NOTES, 2))
+            (dirs['annotations/roasts'] / f"{batch:03d}.md").write_text(
+                f"---\nscore: {rng.randint(80, 92)}\ntastedOn: {(when + datetime.timedelta(days=5)).date()}\n---\n"
+                f"### Tasting notes\n\n{notes}\n")
+            counts['annotations'] += 1
+
+    for i in range(spec.blends):
+        slug = f"house-blend-{i + 1}"
+        (dirs['annotations/blends'] / f"{slug}.md").write_text(
+            f"---\ntitle: House Blend {i + 1}\nslug: {slug}\nbatch: {900 + i}\norigin: {rng.choice(COUNTRIES[:-1])}\n"
+            f"blendDate: {(when - datetime.timedelta(days=i * 10)).date()}\n---\nA blend of the usual suspects.\n")
+        counts['blends'] += 1
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('root', type=Path, help='directory to write the dataset into')
+    parser.add_argument('--roasts', type=int, default=100, help='number of roast files (including forks/aberrant)')
+    parser.add_argument('--beans', type=int, default=None, help='number of bean files (defaults to roasts / 8)')
+    parser.add_argument('--samples', type=int, default=None,
+                        help='samples per curve (defaults to a 9-14 minute roast at 2 samples/second)')
+    parser.add_argument('--fork-rate', type=float, default=0.03, help='share of roasts that are forks')
+    parser.add_argument('--aberrant-rate', type=float, default=0.02, help='share of roasts that are aberrantly named')
+    parser.add_argument('--annotation-rate', type=float, default=0.2, help='share of roasts/beans with annotations')
+    parser.add_argument('--blends', type=int, default=5, help='number of blend annotations')
+    parser.add_argument('--name-style', choices=NAME_STYLES, default='mixed', help='shape of the bean/roast names')
+    parser.add_argument('--seed', type=int, default=322)
+    args = parser.parse_args()
+
+    result = generate_dataset(args.root, DatasetSpec(args.roasts, args.beans, args.samples, args.fork_rate,
+                                                     args.aberrant_rate, args.annotation_rate, args.blends,
+                                                     args.name_style, args.seed))
+    print(json.dumps(result))
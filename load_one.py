@@ -1,12 +1,15 @@
 """
-This script is intended to be run in the interactive shell, load up the roastId listed up the top
-and leave the shell interactive and open for querying and exploration.
+This script is intended to be run in the interactive shell (python -i load_one.py 322), load up the roast given on
+the command line (by batch number or name, defaulting to the one listed up the top) and leave the shell interactive
+and open for querying and exploration.
 
-Otherwise, main() should be importable from an interactive shell, with the roastId as an argument
+Otherwise, load_first_matching() should be importable from an interactive shell, with the batch or name as an argument
 """
-from typing import Union
+import argparse
+from typing import Tuple, Union
 
 import ballistics
+from ballistics.catalog import RoastEntry
 from pprint import pprint
 
 
@@ -17,27 +20,36 @@ selected_roast = '322'
 ##########
 
 
+def batch_order(entry: RoastEntry) -> Tuple[int, int, str]:
+    """
+    :return: sort key ordering roasts by batch number as a number (so 322 comes before 1000), with any batch that isn't
+        a number after all the ones that are
+    """
+    batch = entry.batch.strip()
+    return (0, int(batch), batch) if batch.isdigit() else (1, 0, batch)
+
+
 def load_first_matching(partial: str) -> Union[ballistics.Roast, None]:
     """
-    Loads the first matching roast that contains the batch number.
-    If you use the (nominally unique) bach number, it will reliably return the correct roast.
-    :param partial: intended to be the batch number
-    :return:
+    Loads the roast with that exact batch number, or failing that the first roast (by batch) whose name contains it.
+    :param partial: the batch number, or (part of) the roast name
+    :return: the Roast, or None if nothing matches
     """
-    if roast_dict := ballistics.find_roast_by(partial):
-        return ballistics.Roast(roast_dict.get(list(roast_dict.keys())[0])[0])
+    if matches := ballistics.catalog.find_batch(partial) or ballistics.catalog.search_roasts(partial):
+        return ballistics.Roast(min(matches, key=batch_order).roastId)
     else:
         return None
 
 
 if __name__ == '__main__':
-    roast = load_first_matching(selected_roast)
+    parser = argparse.ArgumentParser(description='Load one roast for exploration')
+    parser.add_argument('roast', nargs='?', default=selected_roast, help='batch number or (part of) the roast name')
+    args = parser.parse_args()
+    roast = load_first_matching(args.roast)
+    if roast is None:
+        raise SystemExit(f"No roast matching {args.roast}")
+    # raw only holds the header fields, the loooooong arrays are in roast.curves (and roast.load_raw() has everything)
     roastj = roast.raw
-    # this removes the loooooong arrays before printing them out, to aid in human readability
-    roastj.pop('actions')
-    roastj.pop('beanDerivative')
-    roastj.pop('beanTemperature')
-    roastj.pop('drumTemperature')
-    roastj.pop('exitTemperature')
-    roastj.pop('ibtsDerivative')
     pprint(roastj)
+    curves = roast.curves
+    pprint({name: f"{len(curve)} samples" for name, curve in curves.items()})
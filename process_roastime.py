@@ -12,12 +12,23 @@ for each roast and bean, and saving those files in a publish directory.
 The intent here is that some website generator takes that information to publish it to a website.
 I use gatsbyjs for this, and have a related project that takes this in and publishes it.
 """
+import argparse
 import datetime
-import shutil
 import frontmatter
+from pathlib import Path
+from typing import Iterable, List
 
 import ballistics.utils
-from ballistics import config, BeanCollection, merge_markdown, RoastCollection, generate_large_label
+from ballistics import config, catalog, bean_registry, BeanCollection, merge_markdown, Roast, RoastCollection
+from ballistics.archive import export_archive
+from ballistics.assets import publish_file, publish_stats
+from ballistics.curvestore import curve_store
+from ballistics.labels import LabelSpec, render_labels
+from ballistics.manifest import BuildManifest, label_fingerprint
+from ballistics.reports import bean_usage_report
+from ballistics.tracing import tracer
+from ballistics.utils import write_if_changed, write_stats, WriteStats
+from ballistics.watch import Watcher
 from pprint import pprint
 
 
@@ -25,36 +36,126 @@ from pprint import pprint
 # Config
 ##########
 
+# the merged markdown written to the publish directory is counted apart from the generated markdown (write_stats)
+merge_stats = WriteStats()
 
-def ingest_beans(coll: BeanCollection):
+
+def config_values() -> dict:
+    """
+    The config values that end up in the generated markdown and labels, so a change to any of them forces a rebuild
+    :return: dict of config values
+    """
+    return {
+        'baseUrl': config.baseUrl,
+        'bestDaysStart': config.bestDaysStart,
+        'bestDaysEnd': config.bestDaysEnd,
+        'roastLevels': config.roastLevels,
+    }
+
+
+def ingest_beans(coll: BeanCollection, manifest: BuildManifest = None):
     """
     Take in a collection of Beans, and "ingest" them - ie, turn them into markdown in the output directory.
     :param coll: BeanCollection to process
+    :param manifest: (optional) build manifest, if given only the beans whose inputs have changed are regenerated
     """
     # TODO: if the collections could iterate, this function could service both ingesting beans and roasts
     for bean in coll.beans:
+        if manifest:
+            # a bean page lists its roasts, so it is rebuilt when any of them change too
+            roast_files = [catalog.roast(roast_id).path for roast_id in bean.roasts]
+            digest = manifest.digest([bean.path] + roast_files, config_values())
+            if manifest.is_current(bean.markdown_file, digest):
+                continue
         log.debug(f"Ingesting {bean.name}")
-        bean.to_markdown()
+        with tracer.span('markdown', item=bean.name):
+            bean.to_markdown()
+        if manifest:
+            manifest.record(bean.markdown_file, digest)
 
 
-def ingest_roasts(coll: RoastCollection):
+def roast_markdown_digest(roast: Roast, manifest: BuildManifest) -> str:
+    """
+    :param roast: the Roast
+    :param manifest: build manifest
+    :return: the digest of everything that goes into the roast's markdown
+    """
+    # the markdown only links to the images that exist when it is written
+    md_values = dict(config_values(), label=roast.label_file.exists(), profile=roast.profile_file.exists())
+    return manifest.digest([roast.path, roast.bean.path], md_values)
+
+
+def ingest_roasts(coll: RoastCollection, manifest: BuildManifest = None):
     """
     Take in a collection of Roasts, and "ingest" them - ie, turn them into markdown in the output directory.
     :param coll: RoastCollection to process
+    :param manifest: (optional) build manifest, if given only the roasts whose inputs have changed are regenerated
     """
     # TODO: if the collections could iterate, this function could service both ingesting beans and roasts
+    labels = dict()
+    # roasts whose markdown was written before their label existed, so it doesn't link to it yet
+    unlabelled = dict()
     for roast in coll.roasts:
         log.debug(f"Ingesting {roast.name}")
-        roast.to_markdown()
-        roast.generate_labels()
-        # TODO: generate profile graph
+        inputs = [roast.path, roast.bean.path]
+        # the profile graph goes first, so the markdown can link to it
+        if manifest:
+            graph_digest = manifest.digest([roast.path], label_fingerprint(config.graphs['profile']))
+            if not manifest.is_current(roast.profile_file, graph_digest):
+                with tracer.span('profile_graph', item=roast.name):
+                    roast.generate_profile_graph()
+                manifest.record(roast.profile_file, graph_digest)
+        else:
+            with tracer.span('profile_graph', item=roast.name):
+                roast.generate_profile_graph()
+        roast.release_curves()
+        if not roast.label_file.exists():
+            unlabelled[roast.label_file] = roast
+        if manifest:
+            md_digest = roast_markdown_digest(roast, manifest)
+            if not manifest.is_current(roast.markdown_file, md_digest):
+                with tracer.span('markdown', item=roast.name):
+                    roast.to_markdown()
+                manifest.record(roast.markdown_file, md_digest)
+            label_digest = manifest.digest(inputs, dict(config_values(), label=label_fingerprint(config.labels['large'])))
+            if not manifest.is_current(roast.label_file, label_digest):
+                labels[roast.label_file] = (roast.label_spec(), label_digest)
+        else:
+            with tracer.span('markdown', item=roast.name):
+                roast.to_markdown()
+            labels[roast.label_file] = (roast.label_spec(), None)
+    # labels are CPU bound, so they are rendered across a process pool once all the markdown is done
+    for result in render_labels(spec for spec, _ in labels.values()):
+        if not result.ok:
+            continue
+        if manifest:
+            manifest.record(result.output, labels[result.output][1])
+        # the markdown of a roast that didn't have a label yet is written again, now it can link to it
+        roast = unlabelled.get(result.output)
+        if roast:
+            with tracer.span('markdown', item=roast.name):
+                roast.to_markdown()
+            if manifest:
+                manifest.record(roast.markdown_file, roast_markdown_digest(roast, manifest))
 
 
-def publish_beans() -> int:
+def existing(directory: Path, names: Iterable[str]) -> List[Path]:
+    """
+    :param directory: the directory the files should be in
+    :param names: file names
+    :return: the Paths of the named files that exist in the directory
+    """
+    return [directory / name for name in sorted(set(names)) if (directory / name).exists()]
+
+
+def publish_beans(manifest: BuildManifest = None, names: Iterable[str] = None) -> int:
     """
     Take all the raw beans markdown, for each bean look for an override markdown file for it.
     If found, merge into combined markdown object.
     Save the markdown object to the publish directory for delivery to the website.
+    :param manifest: (optional) build manifest, if given only the beans whose markdown or annotation have changed
+        are merged and republished
+    :param names: (optional) only publish the beans with these markdown file names, defaults to all of them
     :return: the number of files put in the published folder
     """
     published_files = 0
@@ -63,22 +164,29 @@ def publish_beans() -> int:
     publish_dir = config.publishDir / "beans"
     if not publish_dir.exists():
         publish_dir.mkdir(parents=True)
-    for beanf in origin_dir.glob('*.md'):
+    for beanf in origin_dir.glob('*.md') if names is None else existing(origin_dir, names):
         bean_name = beanf.name
         annotf = annotation_dir / bean_name
+        if manifest:
+            digest = manifest.digest([beanf, annotf])
+            if manifest.is_current(publish_dir / bean_name, digest):
+                continue
         log.debug(f"Attempting to merge {beanf} and {annotf}")
-        bean_merged = merge_markdown(beanf, annotf)
-        # write out meta + content as single md file
-        with open(publish_dir / bean_name, "wt") as pubf:
-            pubf.write(bean_merged)
-            published_files += 1
+        with tracer.span('merge', item=bean_name):
+            bean_merged = merge_markdown(beanf, annotf, loader=catalog.annotation)
+            # write out meta + content as single md file
+            write_if_changed(publish_dir / bean_name, bean_merged, merge_stats)
+        published_files += 1
+        if manifest:
+            manifest.record(publish_dir / bean_name, digest)
     return published_files
 
 
-def publish_blends() -> int:
+def publish_blends(manifest: BuildManifest = None) -> int:
     """
     Take all the manually created blends markdown.
     Save the markdown object to the publish directory for delivery to the website.
+    :param manifest: (optional) build manifest, if given only the blends whose inputs have changed are republished
     :return: the number of files put in the published folder
     """
     published_files = 0
@@ -87,32 +195,50 @@ def publish_blends() -> int:
     publish_img_dir = publish_dir / "images"
     if not publish_img_dir.exists():
         publish_img_dir.mkdir(parents=True)
+    labels = list()
     for blendf in origin_dir.glob('*.md'):
-        blend_name = blendf.stem
-        log.debug(f"Processing blend: {blendf}")
         meta = frontmatter.load(blendf).metadata
         slug = meta['slug']
+        labelf = publish_img_dir / f"{slug}.png"
+        blend_date = meta.get('blendDate')
+        if manifest:
+            values = dict(config_values(), label=label_fingerprint(config.labels['large']))
+            if not blend_date:
+                # the label is dated today, so it is rebuilt every day
+                values['today'] = datetime.date.today().isoformat()
+            digest = manifest.digest([blendf], values)
+            if manifest.is_current(publish_dir / blendf.name, digest) and manifest.is_current(labelf, digest):
+                continue
+        log.debug(f"Processing blend: {blendf}")
         batch = f"{(meta['batch']):03d}"  # format the number as 3 digits with leading 0s
         name = meta['title']
         origin = meta['origin']
-        labelf = publish_img_dir / f"{slug}.png"
-        blend_date = meta.get('blendDate')
         if not blend_date:
             blend_date = datetime.datetime.today()
         url = f"{config.baseUrl}blends/{slug}"
-        img = generate_large_label(config.labels['large'], batch, name, url, False, blend_date, blend_date,
-                                   blend_date+datetime.timedelta(days=14), origin, config.logger)
-        shutil.copy2(blendf, publish_dir)
-        img.save(labelf)
+        labels.append((LabelSpec(labelf, batch, name, url, False, blend_date, blend_date,
+                                 blend_date+datetime.timedelta(days=14), origin), blendf, digest if manifest else None))
+    # render all the blend labels across a process pool, and only publish the blends whose label rendered
+    results = render_labels(spec for spec, _, _ in labels)
+    for (spec, blendf, digest), result in zip(labels, results):
+        if not result.ok:
+            continue
+        publish_file(blendf, publish_dir / blendf.name, manifest)
         published_files += 1
+        if manifest:
+            manifest.record(publish_dir / blendf.name, digest)
+            manifest.record(spec.output, digest)
     return published_files
 
 
-def publish_roasts() -> int:
+def publish_roasts(manifest: BuildManifest = None, names: Iterable[str] = None) -> int:
     """
     Take all the raw roasts markdown, for each bean look for an override markdown file for it.
     If found, merge into combined markdown object.
     Save the markdown object to the publish directory for delivery to the website.
+    :param manifest: (optional) build manifest, if given only the roasts whose markdown or annotation have changed
+        are merged and republished
+    :param names: (optional) only publish the roasts with these markdown file names, defaults to all of them
     :return: the number of files put in the published folder
     """
     published_files = 0
@@ -122,36 +248,149 @@ def publish_roasts() -> int:
     image_dir = config.publishDir / "roasts/images"
     if not image_dir.exists():
         image_dir.mkdir(parents=True)
-    for roastf in origin_dir.glob('*.md'):
+    for roastf in origin_dir.glob('*.md') if names is None else existing(origin_dir, names):
         roast_name = roastf.name
         annotf = annotation_dir / roast_name
-        log.debug(f"Attempting to merge {roastf} and {annotf}")
-        roast_merged = merge_markdown(roastf, annotf)
-        # write out meta + content as single md file
-        with open(publish_dir / roast_name, "wt") as pubf:
-            pubf.write(roast_merged)
+        digest = manifest.digest([roastf, annotf]) if manifest else None
+        if not (manifest and manifest.is_current(publish_dir / roast_name, digest)):
+            log.debug(f"Attempting to merge {roastf} and {annotf}")
+            with tracer.span('merge', item=roast_name):
+                roast_merged = merge_markdown(roastf, annotf, loader=catalog.annotation)
+                # write out meta + content as single md file
+                write_if_changed(publish_dir / roast_name, roast_merged, merge_stats)
             published_files += 1
-        labelf = origin_dir / f"images/{roastf.stem}.png"
-        log.debug(f"Looking for this doc {labelf}")
-        if labelf.exists():
-            log.debug(f"copying {labelf} to {image_dir}")
-            shutil.copy2(labelf, image_dir)
+            if manifest:
+                manifest.record(publish_dir / roast_name, digest)
+        for imagef in (origin_dir / f"images/{roastf.stem}.png", origin_dir / f"images/{roastf.stem}-profile.png"):
+            log.debug(f"Looking for this doc {imagef}")
+            if not imagef.exists():
+                continue
+            digest = manifest.digest([imagef]) if manifest else None
+            if manifest and manifest.is_current(image_dir / imagef.name, digest):
+                continue
+            log.debug(f"publishing {imagef} to {image_dir}")
+            with tracer.span('publish_file', item=imagef.name):
+                publish_file(imagef, image_dir / imagef.name, manifest)
+            if manifest:
+                manifest.record(image_dir / imagef.name, digest)
     return published_files
 
 
+def process_changes(files: List[Path], manifest: BuildManifest) -> None:
+    """
+    Regenerate and republish only what a batch of changed files affects: the changed roasts (markdown, label and
+    profile graph), the pages of their beans, the roasts of any changed bean, and the changed annotations.
+    :param files: Paths of the roast, bean and annotation files that changed
+    :param manifest: build manifest, so only the outputs whose inputs have actually changed are rebuilt
+    """
+    roast_ids, bean_ids = catalog.refresh(files)
+    for bean_id in bean_ids:
+        bean_registry.invalidate(bean_id)
+    bean_ids = sorted(bean_id for bean_id in bean_ids if bean_id in catalog.beans)
+    for roast_id in sorted(roast_id for roast_id in roast_ids if roast_id not in catalog.roasts):
+        log.info(f"Roast {roast_id} was deleted, its published files have been left in place")
+    # a roast's markdown includes details of its bean, so the roasts of every affected bean are checked too (the
+    # manifest skips the ones that haven't changed)
+    roast_ids = sorted({roast_id for roast_id in roast_ids if roast_id in catalog.roasts} |
+                       {roast_id for bean_id in bean_ids for roast_id in catalog.roasts_for_bean(bean_id)})
+    rc = RoastCollection(roast_ids=roast_ids)
+    bc = BeanCollection(bean_ids=bean_ids)
+    annotated = {kind: [file.name for file in files if file.parent == config.annotationsDir / kind]
+                 for kind in ('roasts', 'beans', 'blends')}
+    if bc.beans:
+        ingest_beans(bc, manifest)
+    if rc.roasts:
+        ingest_roasts(rc, manifest)
+    num_beans = publish_beans(manifest, [bean.markdown_file.name for bean in bc.beans] + annotated['beans'])
+    num_roasts = publish_roasts(manifest, [roast.markdown_file.name for roast in rc.roasts] + annotated['roasts'])
+    num_blends = publish_blends(manifest) if annotated['blends'] else 0
+    if roast_ids:
+        bean_usage_report()
+    manifest.save()
+    catalog.save()
+    log.info(f"Published {num_roasts} roasts, {num_beans} beans and {num_blends} blends "
+             f"from {len(files)} changed files")
+
+
+def watch(manifest: BuildManifest) -> None:
+    """
+    Watch the roasts, beans and annotations directories, and process each batch of changes as soon as the files have
+    settled (see ballistics.watch), until interrupted
+    :param manifest: build manifest, kept up to date (and saved) after every batch
+    """
+    dirs = [config.roasts_dir, config.beans_dir]
+    dirs += [config.annotationsDir / kind for kind in ('roasts', 'beans', 'blends')]
+    watcher = Watcher(dirs, settle=config.watchSettle, poll=config.watchPoll)
+    log.info(f"Watching {config.src_dir} and {config.annotationsDir} for changes (Ctrl-C to stop): {watcher}")
+    try:
+        for files in watcher.changes():
+            log.debug(f"Changed: {', '.join(str(file) for file in files)}")
+            try:
+                with tracer.span('watch', files=len(files)) as timer:
+                    process_changes(files, manifest)
+                log.info(f"Processed {len(files)} changed files in {timer.time(running_total=True):.2f}s")
+            except Exception as e:
+                # keep watching - the next change to the file gets another go
+                log.exception(f"Failed to process {len(files)} changed files: {e}")
+    except KeyboardInterrupt:
+        log.info("Stopped watching")
+    finally:
+        watcher.close()
+
+
 if __name__ == '__main__':
-    bc = BeanCollection()
-    rc = RoastCollection()
+    parser = argparse.ArgumentParser(description='Process all the RoasTime roasts and beans, and publish them')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only regenerate the outputs whose inputs have changed since the last run')
+    parser.add_argument('--archive', action='store_true',
+                        help='also export every roast (header and curves) to a columnar archive for analysis')
+    parser.add_argument('--curve-store', action='store_true',
+                        help='append new and changed roasts to the memory-mapped curve store before processing')
+    parser.add_argument('--parallel', action='store_true',
+                        help='parse the roast files that are new or have changed across a pool of processes')
+    parser.add_argument('--watch', action='store_true',
+                        help='after processing everything, keep watching for new and changed files and process those')
+    args = parser.parse_args()
+
+    # the roasts go first, so that a parallel load of the catalog isn't pre-empted by the beans
+    with tracer.span('load'):
+        rc = RoastCollection(parallel=args.parallel)
+        bc = BeanCollection()
     log = config.logger
-    ingest_beans(bc)
+    manifest = BuildManifest(config.manifestFile) if args.incremental else None
+    # the published files only depend on the generated markdown and the annotations, so publishing is always incremental
+    publish_manifest = manifest or BuildManifest(config.manifestFile)
+    if args.curve_store:
+        with tracer.span('curve_store'):
+            curve_store.update()
+    with tracer.span('ingest_beans', count=len(bc.beans)):
+        ingest_beans(bc, manifest)
     log.info(f"Ingested {len(bc.beans)} beans into {config.outputDir}")
-    num_pub = publish_beans()
+    with tracer.span('publish_beans'):
+        num_pub = publish_beans(publish_manifest)
     log.info(f"Published {num_pub} of {len(bc.beans)} beans into {config.publishDir}")
-    ingest_roasts(rc)
-    log.info(f"Ingested {len(rc.roasts)} roasts into {config.outputDir}")
-    num_pub = publish_roasts()
+    with tracer.span('ingest_roasts', count=len(rc.roasts)):
+        ingest_roasts(rc, manifest)
+    log.info(f"Ingested {len(rc.roasts)} roasts into {config.outputDir} (markdown: {write_stats})")
+    with tracer.span('publish_roasts'):
+        num_pub = publish_roasts(publish_manifest)
     log.info(f"Published {num_pub} of {len(bc.beans)} roasts into {config.publishDir}")
     # blends are a little different, as there is no RT/RW data to bring in
     # so just publish it... but the publishing also needs to create the label
-    num_pub = publish_blends()
+    with tracer.span('publish_blends'):
+        num_pub = publish_blends(publish_manifest)
     log.info(f"Published {num_pub} blends into {config.publishDir}")
+    log.info(f"Published assets: {publish_stats} (merged markdown: {merge_stats})")
+    with tracer.span('report'):
+        log.info(f"Wrote the bean usage report to {bean_usage_report()}")
+    if args.archive:
+        with tracer.span('archive'):
+            export_archive()
+    publish_manifest.save()
+    catalog.save()
+    if manifest:
+        log.info(f"Incremental build: {manifest}")
+    log.info(f"Timings:\n{tracer.summary()}")
+    log.info(f"Wrote the timing trace to {tracer.write_chrome_trace(config.traceFile)}")
+    if args.watch:
+        watch(publish_manifest)
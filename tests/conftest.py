@@ -0,0 +1,32 @@
+"""
+Shared fixtures
+"""
+import logging
+
+import pytest
+
+from ballistics.config import config
+from benchmarks.synthetic import DatasetSpec, generate_dataset
+
+
+@pytest.fixture
+def test_config(monkeypatch):
+    """
+    Mark the config as initialized (so nothing is read from the environment) and log to a test logger
+    """
+    monkeypatch.setattr(config, 'initialized', True)
+    monkeypatch.setattr(config, 'logger', logging.getLogger('ballistics-tests'))
+    return config
+
+
+@pytest.fixture
+def roastime(tmp_path, monkeypatch, test_config):
+    """
+    A small synthetic RoasTime directory, with the config pointed at it (and no header cache)
+    """
+    generate_dataset(tmp_path, DatasetSpec(roasts=6, beans=3, samples=200, fork_rate=0, aberrant_rate=0))
+    monkeypatch.setattr(config, 'roasts_dir', tmp_path / 'roasts')
+    monkeypatch.setattr(config, 'beans_dir', tmp_path / 'beans')
+    monkeypatch.setattr(config, 'cacheFile', None)
+    monkeypatch.setattr(config, 'ioWorkers', 1)
+    return tmp_path
@@ -0,0 +1,45 @@
+"""
+Tests for the roast analytics
+"""
+import os
+
+import numpy as np
+
+import ballistics.analytics
+from ballistics.analytics import roast_analytics
+from ballistics.archive import export_archive
+from ballistics.catalog import BallisticsCatalog
+from ballistics.curves import read_curves
+from ballistics.curvestore import CurveStore
+
+
+def test_analytics_read_the_stored_curves_before_the_roast_files(roastime, monkeypatch):
+    catalog = BallisticsCatalog()
+    catalog.load()
+    entries = sorted(catalog.roasts.values(), key=lambda entry: entry.roastId)
+    expected = roast_analytics(entries, loader=read_curves)
+
+    # two roasts in the curve store, two more in the archive, and one that has changed since it was archived
+    store = CurveStore(roastime / 'curves.f32')
+    store.update(entries[:2])
+    monkeypatch.setattr(ballistics.analytics, 'curve_store', store)
+    monkeypatch.setattr(ballistics.analytics.config, 'archiveFile', roastime / 'roasts.npz')
+    export_archive(roastime / 'roasts.npz', entries[2:5])
+    changed = entries[4].path
+    os.utime(changed, ns=(changed.stat().st_atime_ns, (roastime / 'roasts.npz').stat().st_mtime_ns + 10 ** 9))
+    parsed = list()
+
+    def counting_read_curves(path):
+        parsed.append(path)
+        return read_curves(path)
+
+    monkeypatch.setattr(ballistics.analytics, 'read_curves', counting_read_curves)
+    results = roast_analytics(entries)
+
+    assert sorted(parsed) == sorted(entry.path for entry in entries[4:])
+    assert results.keys() == expected.keys()
+    for name, column in expected.items():
+        if column.dtype == object:
+            assert column.tolist() == results[name].tolist()
+        else:
+            np.testing.assert_allclose(results[name], column, equal_nan=True)
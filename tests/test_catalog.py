@@ -0,0 +1,57 @@
+"""
+Tests for the catalog
+"""
+import json
+import logging
+
+from ballistics.catalog import BallisticsCatalog
+from ballistics.config import config
+
+
+def test_refresh_skips_a_file_cut_off_mid_header(roastime, caplog):
+    catalog = BallisticsCatalog()
+    catalog.load()
+    truncated, renamed = sorted((roastime / 'roasts').iterdir())[:2]
+    old_name = catalog.roasts[truncated.name].name
+    # a roast that RoasTime is still writing, cut off part way through its header
+    text = truncated.read_text()
+    truncated.write_text(text[:text.index('"weightGreen"') + 5])
+    header = json.loads(renamed.read_text())
+    header['roastName'] = '999 - Renamed'
+    renamed.write_text(json.dumps(header))
+
+    with caplog.at_level(logging.WARNING, logger='ballistics-tests'):
+        roast_ids, _ = catalog.refresh([truncated, renamed])
+
+    # the rest of the batch is still processed, and the half written roast keeps its old entry until it changes again
+    assert roast_ids == {renamed.name}
+    assert catalog.roasts[renamed.name].name == '999 - Renamed'
+    assert catalog.roasts[truncated.name].name == old_name
+    assert "can't be parsed (yet)" in caplog.text
+
+
+def test_bean_usage_is_worked_out_once_until_a_roast_changes(roastime):
+    catalog = BallisticsCatalog()
+    catalog.load()
+    usage = catalog.bean_usage()
+    assert catalog.bean_usage() is usage
+    assert sum(bean.roastCount for bean in usage.values()) == 6
+
+    removed = sorted((roastime / 'roasts').iterdir())[0]
+    removed.unlink()
+    catalog.refresh([removed])
+    assert sum(bean.roastCount for bean in catalog.bean_usage().values()) == 5
+
+
+def test_bean_usage_drops_a_bean_once_its_last_roast_is_removed(roastime):
+    catalog = BallisticsCatalog()
+    catalog.load()
+    bean_id, roast_ids = next(iter(catalog.bean_roasts.items()))
+    removed = [roastime / 'roasts' / roast_id for roast_id in roast_ids]
+    for file in removed:
+        file.unlink()
+    catalog.refresh(removed)
+
+    assert bean_id not in catalog.bean_roasts
+    assert bean_id not in catalog.bean_usage()
+    assert catalog.roasts_for_bean(bean_id) == list()
@@ -0,0 +1,41 @@
+"""
+Tests for the memory-mapped curve store
+"""
+import json
+
+import numpy as np
+
+from ballistics.catalog import RoastEntry
+from ballistics.curves import CURVE_NAMES, read_curves
+from ballistics.curvestore import CurveStore
+
+
+def write_roast(path, curves):
+    path.write_text(json.dumps(dict(uid=path.name, roastName=f"001 - {path.name}", isFork=0, **curves)))
+    return RoastEntry(roastId=path.name, path=path, name=f"001 - {path.name}")
+
+
+def test_curves_match_read_curves(tmp_path, test_config):
+    roasts = tmp_path / 'roasts'
+    roasts.mkdir()
+    entries = [
+        # every curve, all the same length
+        write_roast(roasts / 'full', {name: [float(i) for i in range(50)] for name in CURVE_NAMES}),
+        # a missing curve and a short one
+        write_roast(roasts / 'ragged', {'beanTemperature': [180.0 + i for i in range(40)],
+                                        'drumTemperature': [240.0] * 40, 'exitTemperature': [150.0] * 7,
+                                        'beanDerivative': [12.5] * 40}),
+    ]
+    store = CurveStore(tmp_path / 'curves.f32')
+    assert store.update(entries) == 2
+
+    for entry in entries:
+        stored = store.curves(entry.roastId, entry.path)
+        expected = read_curves(entry.path)
+        assert stored.keys() == expected.keys()
+        for name in CURVE_NAMES:
+            assert stored[name].dtype == expected[name].dtype
+            np.testing.assert_array_equal(stored[name], expected[name])
+    ragged = store.curves('ragged')
+    assert len(ragged['ibtsDerivative']) == 0
+    assert len(ragged['exitTemperature']) == 7
@@ -0,0 +1,30 @@
+"""
+Tests for the header-only JSON reader
+"""
+import json
+
+import pytest
+
+from ballistics.jsonheader import parse_json_header
+
+ROAST = json.dumps({'uid': 'abc', 'roastName': '007 - Kenya', 'weightGreen': 350, 'isFork': 0,
+                    'beanTemperature': [180.5, 181.0, 179.5], 'actions': {'actionTimeList': [{'index': 1}]},
+                    'sampleRate': 2})
+
+
+def test_matches_json_load():
+    expected = {key: value for key, value in json.loads(ROAST).items() if not isinstance(value, (list, dict))}
+    assert parse_json_header(ROAST) == expected
+
+
+@pytest.mark.parametrize('text', ['', '{', '{"a": 1', '{"a": 1,', '{"a"', '{"a":', '{"a": 1 ', '{"a": "x'])
+def test_truncated_input_raises_value_error(text):
+    with pytest.raises(ValueError):
+        parse_json_header(text)
+
+
+def test_every_truncation_raises_value_error():
+    # a file that's still being written can be cut off anywhere
+    for end in range(len(ROAST)):
+        with pytest.raises(ValueError):
+            parse_json_header(ROAST[:end])
@@ -0,0 +1,19 @@
+"""
+Tests for the profile graph
+"""
+import logging
+
+import numpy as np
+from PIL import ImageFont
+
+from ballistics.utils import generate_profile_graph
+
+GRAPH = {'width': 300, 'height': 150, 'margin': 20, 'font': ImageFont.load_default()}
+
+
+def test_graph_without_temperatures_still_draws_the_rate_of_rise():
+    empty = np.zeros(0, dtype=np.float32)
+    curves = {'beanTemperature': empty, 'drumTemperature': empty, 'exitTemperature': empty,
+              'beanDerivative': np.linspace(0.0, 20.0, 100, dtype=np.float32)}
+    img = generate_profile_graph(GRAPH, curves, 1.0, {'Start': 0}, logging.getLogger('ballistics-tests'))
+    assert img.size == (300, 150)
@@ -0,0 +1,15 @@
+"""
+Tests for the QR code cache
+"""
+from ballistics.qrcache import QRCache
+
+
+def test_disk_cache_only_holds_complete_pngs(tmp_path):
+    cache = QRCache(tmp_path)
+    img = cache.get('https://example.com/roasts/322')
+    assert [file.name for file in tmp_path.iterdir()] == [QRCache.key_name(('https://example.com/roasts/322', 10, 1, 1))]
+
+    # a new cache (eg in another process) reads it back from disk
+    other = QRCache(tmp_path)
+    assert other.get('https://example.com/roasts/322').tobytes() == img.tobytes()
+    assert (other.hits, other.misses) == (1, 0)
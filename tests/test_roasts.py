@@ -0,0 +1,24 @@
+"""
+Tests for Roast
+"""
+from ballistics import catalog, Roast
+from ballistics.config import config
+
+
+def test_raw_is_a_copy_of_the_catalog_header(roastime, monkeypatch):
+    monkeypatch.setattr(config, 'baseUrl', 'https://example.com/')
+    monkeypatch.setattr(config, 'bestDaysStart', 7)
+    monkeypatch.setattr(config, 'bestDaysEnd', 14)
+    monkeypatch.setattr(config, 'roastLevels', ['Light', 'Medium', 'Dark'] * 4)
+    # the shared catalog is reloaded from the synthetic directory, and left to be reloaded again afterwards
+    monkeypatch.setattr(catalog, 'initialized', False)
+    catalog.load()
+    roast_id = sorted(catalog.roasts)[0]
+    roast = Roast(roastId=roast_id)
+
+    raw = roast.raw
+    assert raw == catalog.roast(roast_id).header
+    raw['roastName'] = 'changed'
+    raw['weightGreen'] = 0.0
+    assert catalog.roast(roast_id).header['roastName'] != 'changed'
+    assert Roast(roastId=roast_id).weightGreen == roast.weightGreen